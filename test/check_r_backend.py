@@ -0,0 +1,68 @@
+#!/usr/bin/env python2.7
+
+"""Check that the R changepoint backend, when it segments every process
+execution of a benchmark in a single call into R (mark_changepoints_in_json
+--r-batch), finds exactly the same changepoints, segment means and variances
+as calling cpt.meanvar() on each process execution in turn (the default).
+Input files should have outliers marked.
+"""
+
+import os
+import sys
+
+# R packages are stored relative to the top-level of the repo.
+our_rlibs = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'work', 'rlibs')
+if not os.path.exists(our_rlibs):
+    sys.stderr.write("Please run build.sh first.\n")
+    sys.exit(0)
+if our_rlibs not in os.environ.get('R_LIBS_USER', ''):
+    if 'R_LIBS_USER' in os.environ:
+        os.environ['R_LIBS_USER'] = "%s:%s" % (os.environ['R_LIBS_USER'], our_rlibs)
+    else:
+        os.environ['R_LIBS_USER'] = our_rlibs
+    args = [sys.executable]
+    args.extend(sys.argv)
+    os.execv(sys.executable, args)
+
+# We use a custom install of rpy2, relative to the top-level of the repo.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                'work', 'pylibs'))
+
+import argparse
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from warmup.changepoints import PENALTY, _cpt_meanvar, _cpt_meanvar_all, _remove_outliers
+from warmup.changepoints import import_changepoint
+from warmup.krun_results import read_krun_results_file
+
+def compare(filename):
+    cpt = import_changepoint('r')
+    results = read_krun_results_file(filename)
+    errors = list()
+    for key in sorted(results['wallclock_times']):
+        p_execs = results['wallclock_times'][key]
+        all_outliers = results.get('all_outliers', {}).get(key, [list() for _ in p_execs])
+        kept = [_remove_outliers(data, outliers) for data, outliers in zip(p_execs, all_outliers)]
+        penalties = [PENALTY * numpy.log(len(p_exec)) for p_exec in kept]
+        batched = _cpt_meanvar_all(kept, penalties)
+        for index, (p_exec, penalty) in enumerate(zip(kept, penalties)):
+            if batched[index] != _cpt_meanvar(cpt, p_exec, penalty):
+                errors.append('Segmentations differ for %s execution %d.' % (key, index))
+    return errors
+
+
+def create_cli_parser():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('json_files', nargs='+', help='Krun JSON files to check.')
+    return parser
+
+
+if __name__ == '__main__':
+    options = create_cli_parser().parse_args()
+    errors = list()
+    for filename in options.json_files:
+        errors.extend(compare(filename))
+    for error in errors:
+        print error
+    sys.exit(1 if errors else 0)
@@ -0,0 +1,115 @@
+#!/usr/bin/env python2.7
+
+"""Check that two Krun JSON files, annotated by mark_changepoints_in_json with
+different backends (or options), contain the same changepoints and
+classifications, and segment means / variances which agree to within a
+relative tolerance. With --tolerance, changepoints may instead be up to a
+number of iterations apart (e.g. to compare chunked and unchunked
+segmentations), and the means and variances of process executions whose
+changepoints differ are not compared. How many process executions,
+changepoint positions and classifications agree is printed either way, so
+that test logs record the agreement of the backends.
+"""
+
+import argparse
+import os
+import os.path
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from warmup.krun_results import read_krun_results_file
+
+REL_TOLERANCE = 1e-6
+
+
+def close(value1, value2):
+    return abs(value1 - value2) <= REL_TOLERANCE * max(abs(value1), abs(value2))
+
+
+def agreement(results1, results2):
+    """Return a dictionary counting the process executions of results1, those
+    whose changepoints and classifications agree with results2, and the
+    changepoints of results1 found at the same position in results2.
+    """
+    counts = dict(pexecs=0, same_changepoints=0, same_classifications=0, changepoints=0,
+                  same_positions=0)
+    for key in results1['changepoints']:
+        for p_exec, cpts1 in enumerate(results1['changepoints'][key]):
+            cpts2 = results2['changepoints'].get(key, [])
+            cpts2 = cpts2[p_exec] if p_exec < len(cpts2) else []
+            classifications2 = results2['classifications'].get(key, [])
+            counts['pexecs'] += 1
+            counts['same_changepoints'] += cpts1 == cpts2
+            counts['same_classifications'] += (
+                p_exec < len(classifications2) and
+                results1['classifications'][key][p_exec] == classifications2[p_exec])
+            counts['changepoints'] += len(cpts1)
+            counts['same_positions'] += len(set(cpts1) & set(cpts2))
+    return counts
+
+
+def close_changepoints(cpts1, cpts2, tolerance):
+    return len(cpts1) == len(cpts2) and all(abs(cpoint1 - cpoint2) <= tolerance
+                                            for cpoint1, cpoint2 in zip(cpts1, cpts2))
+
+
+def compare(filename1, filename2, min_changepoints=0, tolerance=0):
+    results1 = read_krun_results_file(filename1)
+    results2 = read_krun_results_file(filename2)
+    counts = agreement(results1, results2)
+    print ('%d of %d process executions have the same changepoints, and %d the same '
+           'classification; %d of %d changepoints are at the same position.' %
+           (counts['same_changepoints'], counts['pexecs'], counts['same_classifications'],
+            counts['same_positions'], counts['changepoints']))
+    errors = list()
+    # Identical results are only a useful check if the data had shifts to find.
+    found = sum(len(cpts) for key in results1['changepoints']
+                for cpts in results1['changepoints'][key])
+    if found < min_changepoints:
+        errors.append('Only %d changepoints found (expected at least %d).' %
+                      (found, min_changepoints))
+    if results1['classifications'] != results2['classifications']:
+        errors.append('classifications differ.')
+    if sorted(results1['changepoints']) != sorted(results2['changepoints']) or \
+            any(len(results1['changepoints'][key]) != len(results2['changepoints'][key])
+                for key in results1['changepoints']):
+        errors.append('changepoints differ.')
+        return errors
+    for key in results1['changepoints']:
+        for p_exec, (cpts1, cpts2) in enumerate(zip(results1['changepoints'][key],
+                                                    results2['changepoints'][key])):
+            if not close_changepoints(cpts1, cpts2, tolerance):
+                errors.append('changepoints differ for %s execution %d.' % (key, p_exec))
+    for field in ('changepoint_means', 'changepoint_vars'):
+        for key in results1[field]:
+            for p_exec, (values1, values2) in enumerate(zip(results1[field][key],
+                                                            results2[field].get(key, []))):
+                if results1['changepoints'][key][p_exec] != \
+                        results2['changepoints'][key][p_exec]:
+                    continue  # Only possible with a tolerance, and checked above.
+                if len(values1) != len(values2) or \
+                        not all(close(v1, v2) for v1, v2 in zip(values1, values2)):
+                    errors.append('%s differ for %s execution %d.' % (field, key, p_exec))
+    return errors
+
+
+def create_cli_parser():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--min-changepoints', action='store', dest='min_changepoints',
+                        default=0, type=int, metavar='N',
+                        help=('Fail unless the first file holds at least N '
+                              'changepoints in total.'))
+    parser.add_argument('--tolerance', action='store', dest='tolerance', default=0,
+                        type=int, metavar='N',
+                        help=('Allow each changepoint to be up to N iterations '
+                              'from its counterpart (default: 0).'))
+    parser.add_argument('json_files', nargs=2, help='Krun JSON files to compare.')
+    return parser
+
+
+if __name__ == '__main__':
+    options = create_cli_parser().parse_args()
+    errors = compare(options.json_files[0], options.json_files[1], options.min_changepoints,
+                     options.tolerance)
+    for error in errors:
+        print error
+    sys.exit(1 if errors else 0)
@@ -1,7 +1,15 @@
 #!/usr/bin/env python2.7
 
-"""Generate random Krun JSON files."""
+"""Generate random Krun JSON files.
 
+By default, two files (test/example1.json.bz2 and test/example2.json.bz2) are
+written, each holding one benchmark with one process execution of 2000
+uniformly random iterations. The options below generate larger files, whose
+process executions have realistic shapes (e.g. warmup or slowdown), for
+benchmarking warmup_stats itself (see test/perf.py).
+"""
+
+import argparse
 import os
 import os.path
 import random
@@ -15,26 +23,177 @@ AUDIT = { 'uname': UNAME }
 ITERS = 2000
 KEY = 'dummybmark:dummyvm:0'  # 0th pexec.
 
+# Shapes of the process executions which can be generated. Apart from uniform
+# (random noise between 0 and 1s), each shape is a run sequence around a base
+# time for its benchmark, with a little Gaussian noise:
+#   flat: the base time throughout.
+#   warmup: starts several times slower than the base time, and speeds up
+#           (in a few steps) during the first fifth of the run sequence.
+#   slowdown: the base time, stepping up to a slower time a quarter of the
+#             way through the run sequence.
+#   no steady state: alternates between the base time and a slower time,
+#                    until close to the end of the run sequence.
+SHAPES = ['uniform', 'flat', 'warmup', 'slowdown', 'no steady state']
+NOISE = 0.01  # Standard deviation of the noise, relative to the base time.
+
 
 def create_filename(nth):
     return os.path.join(os.path.dirname(os.path.abspath(__file__)),
                         'example' + str(nth) + '.json.bz2')
 
 
-def create_random_results():
+def create_key(nth, keys):
+    if keys == 1:
+        return KEY
+    return 'dummybmark%d:dummyvm:0' % nth
+
+
+def create_pexec(rng, shape, iterations, base, outlier_rate, integer_rate=0.0):
+    """Return the wallclock times of one process execution. A fraction
+    integer_rate of the times are rounded to whole numbers of microseconds,
+    and stored as integers.
+    """
+    if shape == 'uniform':
+        return [rng.random() for _ in xrange(iterations)]
+    levels = list()  # Sorted list of (first iteration, time) pairs.
+    if shape == 'flat':
+        levels.append((0, base))
+    elif shape == 'warmup':
+        steps = rng.randint(1, 3)
+        for step in xrange(steps):
+            levels.append((step * iterations // (5 * steps),
+                           base * (1 + rng.uniform(1.0, 3.0) * (steps - step) / steps)))
+        levels.append((iterations // 5, base))
+    elif shape == 'slowdown':
+        levels.append((0, base))
+        levels.append((iterations // 4, base * rng.uniform(1.2, 1.5)))
+    elif shape == 'no steady state':
+        slow = base * rng.uniform(1.2, 1.5)
+        period = max(iterations // 10, 1)
+        for step in xrange(10):
+            levels.append((step * period, slow if step % 2 else base))
+        levels.append((iterations - max(iterations // 50, 1), slow))
+    else:
+        raise ValueError('Unknown shape: %s' % shape)
+    times = list()
+    level = 0
+    for iteration in xrange(iterations):
+        while level + 1 < len(levels) and levels[level + 1][0] <= iteration:
+            level += 1
+        value = levels[level][1] * (1 + rng.gauss(0, NOISE))
+        if rng.random() < outlier_rate:
+            value *= rng.uniform(1.5, 3.0)
+        if rng.random() < integer_rate:
+            value = int(round(value * 1000000))
+        times.append(value)
+    return times
+
+
+def create_results(rng, keys=1, pexecs=1, iterations=ITERS, shapes=None,
+                   inconsistent_rate=0.0, outlier_rate=0.0, crash_rate=0.0,
+                   integer_rate=0.0):
+    """Return Krun results for keys benchmarks, each with pexecs process
+    executions of the given number of iterations. Each benchmark is given a
+    shape, picked at random from shapes (by default, uniform), which is used
+    by all of its process executions except for a fraction inconsistent_rate,
+    whose shapes are picked at random. A fraction outlier_rate of iterations
+    are made several times slower, a fraction integer_rate are stored as
+    integers (see create_pexec()), and a fraction crash_rate of process
+    executions crash (i.e. have no iterations).
+    """
+    if shapes is None:
+        shapes = ['uniform']
     results = { 'audit': AUDIT,
-                'wallclock_times': { KEY: [[]] },
-                'core_cycle_counts': { KEY: [[]] },
+                'wallclock_times': dict(),
+                'core_cycle_counts': dict(),
               }
-    for _ in xrange(ITERS):
-        results['wallclock_times'][KEY][0].append(random.random())
+    for nth in xrange(keys):
+        key = create_key(nth, keys)
+        base = rng.uniform(0.01, 1.0)
+        key_shape = rng.choice(shapes)
+        results['wallclock_times'][key] = list()
+        results['core_cycle_counts'][key] = list()
+        for _ in xrange(pexecs):
+            if rng.random() < crash_rate:
+                p_exec = list()
+            else:
+                shape = key_shape
+                if rng.random() < inconsistent_rate:
+                    shape = rng.choice(shapes)
+                p_exec = create_pexec(rng, shape, iterations, base, outlier_rate,
+                                      integer_rate)
+            results['wallclock_times'][key].append(p_exec)
+            results['core_cycle_counts'][key].append(list())
     return results
 
 
+def create_cli_parser():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--keys', '-k', action='store', dest='keys', default=1,
+                        type=int, metavar='N', help='Number of benchmarks in each file.')
+    parser.add_argument('--pexecs', '-p', action='store', dest='pexecs', default=1,
+                        type=int, metavar='N',
+                        help='Number of process executions of each benchmark.')
+    parser.add_argument('--iterations', '-i', action='store', dest='iterations',
+                        default=ITERS, type=int, metavar='N',
+                        help='Number of iterations in each process execution.')
+    parser.add_argument('--shapes', action='store', dest='shapes', default='uniform',
+                        type=str, metavar='SHAPES',
+                        help=('Comma separated list of shapes from which the '
+                              'shape of each benchmark is picked at random. '
+                              'Any of: %s, or all (every shape except '
+                              'uniform).' % ', '.join(SHAPES)))
+    parser.add_argument('--inconsistent-rate', action='store', dest='inconsistent_rate',
+                        default=0.0, type=float, metavar='RATE',
+                        help=('Fraction of process executions whose shape may '
+                              'differ from the other process executions of the '
+                              'same benchmark.'))
+    parser.add_argument('--outlier-rate', action='store', dest='outlier_rate',
+                        default=0.0, type=float, metavar='RATE',
+                        help='Fraction of iterations which are outliers.')
+    parser.add_argument('--integer-rate', action='store', dest='integer_rate',
+                        default=0.0, type=float, metavar='RATE',
+                        help=('Fraction of iterations whose times are stored as '
+                              'integers (of microseconds), to check that they are '
+                              'not confused with floats.'))
+    parser.add_argument('--crash-rate', action='store', dest='crash_rate',
+                        default=0.0, type=float, metavar='RATE',
+                        help='Fraction of process executions which crash.')
+    parser.add_argument('--seed', action='store', dest='seed', default=None,
+                        type=int, metavar='N',
+                        help='Seed the random number generator with N.')
+    parser.add_argument('out_files', nargs='*', default=None,
+                        help=('Files to write (by default, test/example1.json.bz2 '
+                              'and test/example2.json.bz2).'))
+    return parser
+
+
+def parse_shapes(shapes):
+    if shapes == 'all':
+        return SHAPES[1:]
+    shapes = shapes.split(',')
+    for shape in shapes:
+        if shape not in SHAPES:
+            raise ValueError('Unknown shape: %s' % shape)
+    return shapes
+
+
 if __name__ == '__main__':
-    seed = random.randrange(sys.maxint)
+    options = create_cli_parser().parse_args()
+    try:
+        shapes = parse_shapes(options.shapes)
+    except ValueError as error:
+        print error
+        sys.exit(1)
+    seed = options.seed
+    if seed is None:
+        seed = random.randrange(sys.maxint)
     random.seed(a=seed)
     print('Test data was generated with seed: %d' % seed)
-    # We create two example data files, so that we can diff them.
-    write_krun_results_file(create_random_results(), create_filename(1))
-    write_krun_results_file(create_random_results(), create_filename(2))
+    # By default, we create two example data files, so that we can diff them.
+    out_files = options.out_files or [create_filename(1), create_filename(2)]
+    for filename in out_files:
+        results = create_results(random, options.keys, options.pexecs, options.iterations,
+                                 shapes, options.inconsistent_rate, options.outlier_rate,
+                                 options.crash_rate, options.integer_rate)
+        write_krun_results_file(results, filename)
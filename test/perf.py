@@ -0,0 +1,341 @@
+#!/usr/bin/env python2.7
+
+"""Benchmark the stages of the warmup_stats pipeline on synthetic data.
+
+For each size (a number of benchmarks, process executions and iterations),
+two Krun results files are generated with gen_data.py, and each stage is run
+over them by its bin/ script, with --profile:
+
+    outliers      bin/mark_outliers_in_json
+    changepoints  bin/mark_changepoints_in_json
+    summary       bin/warmup_stats --output-json (bootstrap is reported
+                  separately, from the profile of this stage)
+    diff          bin/diff_results
+    plot          bin/plot_krun_results
+
+The wall clock time, CPU time and peak memory of each stage, and the profile
+of each script, are written to a JSON file. Passing an earlier JSON file to
+--compare (e.g. one written before a change, or by an older version of
+warmup_stats) prints the difference between the two, and exits with status 1
+if any stage became slower, or used more memory, by more than --threshold.
+
+Example usage:
+
+    $ python2.7 test/perf.py --sizes 4x5x2000,16x10x2000 -o before.json
+    $ python2.7 test/perf.py --sizes 4x5x2000,16x10x2000 -o after.json --compare before.json
+"""
+
+import argparse
+import json
+import os
+import os.path
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from collections import OrderedDict
+
+import gen_data
+from warmup.krun_results import write_krun_results_file
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BIN = os.path.join(ROOT, 'bin')
+STAGES = ['outliers', 'changepoints', 'summary', 'bootstrap', 'diff', 'plot']
+# Stages whose input is written by an earlier stage.
+DEPENDS = {'changepoints': 'outliers', 'summary': 'changepoints', 'bootstrap': 'summary',
+           'diff': 'changepoints', 'plot': 'changepoints'}
+# Measurements compared by --compare.
+MEASUREMENTS = [('wall', 'Wall (s)', 1.0), ('cpu', 'CPU (s)', 1.0),
+                ('peak_rss_kb', 'Peak RSS (MiB)', 1024.0)]
+
+
+def parse_sizes(sizes):
+    """Parse a comma separated list of KEYSxPEXECSxITERATIONS triples."""
+    parsed = list()
+    for size in sizes.split(','):
+        try:
+            keys, pexecs, iterations = [int(value) for value in size.split('x')]
+        except ValueError:
+            raise ValueError('Sizes must be given as KEYSxPEXECSxITERATIONS, not %s.' % size)
+        if min(keys, pexecs, iterations) < 1:
+            raise ValueError('Every part of a size must be at least 1, not %s.' % size)
+        parsed.append((keys, pexecs, iterations))
+    return parsed
+
+
+def git_version():
+    """Return the git commit of this tree (and whether it has been modified),
+    or None if it is not a git checkout.
+    """
+    try:
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.check_output(['git', 'describe', '--always', '--dirty'],
+                                           cwd=ROOT, stderr=devnull).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args, directory, log):
+    """Run a bin/ script in directory, appending its output to log. Returns
+    a dictionary of its wall clock time, CPU time, peak RSS and exit status.
+    """
+    with open(log, 'a') as log_fd:
+        log_fd.write('$ %s\n' % ' '.join(args))
+        log_fd.flush()
+        start = time.time()
+        process = subprocess.Popen([sys.executable] + args, cwd=directory, stdout=log_fd,
+                                   stderr=subprocess.STDOUT)
+        # Unlike getrusage(), wait4() measures this process (and the
+        # processes it waited for) alone.
+        _, status, usage = os.wait4(process.pid, 0)
+        wall = time.time() - start
+    peak_rss_kb = usage.ru_maxrss
+    if sys.platform == 'darwin':  # Reported in bytes, rather than KiB.
+        peak_rss_kb //= 1024
+    return {'wall': wall, 'cpu': usage.ru_utime + usage.ru_stime,
+            'peak_rss_kb': peak_rss_kb, 'status': os.WEXITSTATUS(status)
+                                                  if os.WIFEXITED(status) else -1}
+
+
+def run_stage(name, args, directory, log, repeat):
+    """Run a stage repeat times, and return the measurements (and profile)
+    of its fastest run. If a run exits successfully without writing its
+    profile (e.g. diff_results exits with status 0 if R is not installed),
+    its status is None.
+    """
+    profile_file = os.path.join(directory, name + '.profile.json')
+    best = None
+    for _ in xrange(repeat):
+        if os.path.exists(profile_file):
+            os.remove(profile_file)
+        measured = run(args + ['--profile', profile_file], directory, log)
+        if measured['status'] == 0 and not os.path.exists(profile_file):
+            measured['status'] = None
+        if measured['status'] != 0:
+            return measured
+        if best is None or measured['wall'] < best['wall']:
+            best = measured
+            with open(profile_file, 'r') as fd:
+                best['profile'] = json.load(fd)['totals']
+    return best
+
+
+def benchmark_size(keys, pexecs, iterations, options, directory):
+    """Generate data of one size in directory, and benchmark each stage of
+    options.stages on it. Returns a dictionary of the measurements of each
+    stage. Stages which write the inputs of options.stages are also run, but
+    are not reported.
+    """
+    log = os.path.join(directory, 'perf.log')
+    files = ['before.json.bz2', 'after.json.bz2']
+    rng = random.Random(options.seed)
+    for filename in files:
+        results = gen_data.create_results(rng, keys, pexecs, iterations, options.shapes,
+                                          options.inconsistent_rate, options.outlier_rate,
+                                          options.crash_rate)
+        write_krun_results_file(results, os.path.join(directory, filename))
+    window = min(options.window, iterations)
+    steady = options.steady if options.steady is not None else max(iterations // 4, 1)
+    outliers = ['%s_outliers_w%d.json.bz2' % (filename[:-9], window) for filename in files]
+    changepoints = [filename[:-9] + '_changepoints.json.bz2' for filename in outliers]
+    commands = OrderedDict([
+        ('outliers', [os.path.join(BIN, 'mark_outliers_in_json'), '-w', str(window)] + files),
+        ('changepoints', [os.path.join(BIN, 'mark_changepoints_in_json'), '-s', str(steady),
+                          '--backend', options.backend, '-j', str(options.jobs)] + outliers),
+        # Keys must be unique across the inputs of a summary, so only one of
+        # the two files is summarised.
+        ('summary', [os.path.join(BIN, 'warmup_stats'), '--output-json', 'summary.json',
+                     '--backend', options.backend, '-j', str(options.jobs),
+                     changepoints[0]]),
+        ('diff', [os.path.join(BIN, 'diff_results'), '--html', 'diff.html', '-j',
+                  'diff.json', '-r'] + changepoints),
+        ('plot', [os.path.join(BIN, 'plot_krun_results'), '--with-outliers',
+                  '--with-changepoints', '-o', 'plots.pdf', changepoints[0]]),
+    ])
+    needed = set()
+    for name in options.stages:
+        while name is not None:
+            needed.add(name)
+            name = DEPENDS.get(name)
+    stages = OrderedDict()
+    for name in STAGES:
+        if name not in needed:
+            continue
+        depends = DEPENDS.get(name)
+        if depends is not None and (depends not in stages or stages[depends]['status'] != 0):
+            print '  %-14s skipped (%s did not run)' % (name, depends)
+            continue
+        if name == 'bootstrap':
+            # Times are summed over the --jobs worker processes of summary,
+            # and memory is the largest RSS at the end of a bootstrap.
+            total = stages['summary']['profile'].get('bootstrap')
+            if total is None:
+                # No benchmark reached a steady state, so none was bootstrapped.
+                print '  %-14s not run (no benchmark reached a steady state)' % name
+                stages[name] = {'status': None}
+                continue
+            stages[name] = {'wall': total['wall'], 'cpu': total['cpu'],
+                            'peak_rss_kb': total.get('rss_end_kb', 0),
+                            'calls': total['calls'], 'status': 0}
+        else:
+            stages[name] = run_stage(name, commands[name], directory, log, options.repeat)
+        measured = stages[name]
+        if name not in options.stages:
+            continue
+        elif measured['status'] is None:
+            print '  %-14s skipped (wrote no profile; see %s)' % (name, log)
+        elif measured['status'] != 0:
+            print '  %-14s FAILED with status %d (see %s)' % (name, measured['status'], log)
+        else:
+            print '  %-14s %8.3fs wall %8.3fs CPU %8.1f MiB' % \
+                (name, measured['wall'], measured['cpu'], measured['peak_rss_kb'] / 1024.0)
+    return OrderedDict((name, stages[name]) for name in stages if name in options.stages)
+
+
+def compare(old, new, threshold):
+    """Print the change in each measurement of every stage which appears in
+    both old and new (as written by this script). Returns the number of
+    regressions, i.e. measurements which grew by more than threshold percent.
+    """
+    print 'Comparing %s (%s) with %s (%s).' % (old.get('version'), old.get('date'),
+                                               new.get('version'), new.get('date'))
+    print '%-20s %-14s %-16s %10s %10s %8s' % ('Size', 'Stage', 'Measurement', 'Old', 'New',
+                                                 'Change')
+    regressions = 0
+    old_sizes = dict((tuple(size['size']), size['stages']) for size in old['results'])
+    for size in new['results']:
+        old_stages = old_sizes.get(tuple(size['size']))
+        if old_stages is None:
+            continue
+        for name, measured in size['stages'].items():
+            if measured['status'] != 0 or old_stages.get(name, {}).get('status') != 0:
+                continue
+            for field, label, scale in MEASUREMENTS:
+                old_value, new_value = old_stages[name][field], measured[field]
+                change = 100.0 * (new_value - old_value) / old_value if old_value else 0.0
+                flag = ''
+                if change > threshold:
+                    flag = ' REGRESSION'
+                    regressions += 1
+                print '%-20s %-14s %-16s %10.3f %10.3f %+7.1f%%%s' % \
+                    ('x'.join(str(part) for part in size['size']), name, label,
+                     old_value / scale, new_value / scale, change, flag)
+    return regressions
+
+
+def create_cli_parser():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', action='store', dest='sizes', default='4x5x2000',
+                        type=str, metavar='SIZES',
+                        help=('Comma separated list of sizes of input data, each '
+                              'given as KEYSxPEXECSxITERATIONS.'))
+    parser.add_argument('--stages', action='store', dest='stages', default=','.join(STAGES),
+                        type=str, metavar='STAGES',
+                        help=('Comma separated list of stages to benchmark (by '
+                              'default, all of %s).' % ', '.join(STAGES)))
+    parser.add_argument('--shapes', action='store', dest='shapes',
+                        default='flat,warmup,slowdown', type=str, metavar='SHAPES',
+                        help=('Shapes of process executions (see gen_data.py). '
+                              'By default, only shapes which reach a steady '
+                              'state, so that the bootstrap stage is timed.'))
+    parser.add_argument('--inconsistent-rate', action='store', dest='inconsistent_rate',
+                        default=0.2, type=float, metavar='RATE',
+                        help=('Fraction of process executions whose shape may '
+                              'differ from the other process executions of the '
+                              'same benchmark.'))
+    parser.add_argument('--outlier-rate', action='store', dest='outlier_rate',
+                        default=0.01, type=float, metavar='RATE',
+                        help='Fraction of iterations which are outliers.')
+    parser.add_argument('--crash-rate', action='store', dest='crash_rate',
+                        default=0.0, type=float, metavar='RATE',
+                        help=('Fraction of process executions which crash. '
+                              'Crashed process executions are not segmented or '
+                              'classified.'))
+    parser.add_argument('--seed', action='store', dest='seed', default=0, type=int,
+                        metavar='N', help='Seed for the generated data.')
+    parser.add_argument('--window', '-w', action='store', dest='window', default=200,
+                        type=int, metavar='N', help='Window size for outliers.')
+    parser.add_argument('--steady', '-s', action='store', dest='steady', default=None,
+                        type=int, metavar='N',
+                        help=('Expect a steady state to be reached before the '
+                              'last N iterations (by default, a quarter of the '
+                              'iterations).'))
+    parser.add_argument('--backend', action='store', dest='backend', default='python',
+                        choices=['r', 'python'], help='Changepoint backend to use.')
+    parser.add_argument('--jobs', '-j', action='store', dest='jobs', default=1, type=int,
+                        metavar='N', help='Worker processes used by each stage.')
+    parser.add_argument('--repeat', '-r', action='store', dest='repeat', default=1,
+                        type=int, metavar='N',
+                        help='Run each stage N times, and keep the fastest run.')
+    parser.add_argument('--work-dir', action='store', dest='work_dir', default=None,
+                        metavar='DIR',
+                        help=('Keep generated data and outputs in DIR, rather '
+                              'than in a temporary directory.'))
+    parser.add_argument('--output', '-o', action='store', dest='output', default=None,
+                        metavar='FILE', help='Write the results to FILE as JSON.')
+    parser.add_argument('--compare', '-c', action='store', dest='compare', default=None,
+                        metavar='FILE',
+                        help='Compare the results with those in FILE.')
+    parser.add_argument('--threshold', '-t', action='store', dest='threshold',
+                        default=10.0, type=float, metavar='PERCENT',
+                        help=('Report a regression if a measurement grows by more '
+                              'than PERCENT (default 10) compared to --compare.'))
+    return parser
+
+
+if __name__ == '__main__':
+    options = create_cli_parser().parse_args()
+    try:
+        sizes = parse_sizes(options.sizes)
+        options.shapes = gen_data.parse_shapes(options.shapes)
+    except ValueError as error:
+        print error
+        sys.exit(1)
+    options.stages = options.stages.split(',')
+    for name in options.stages:
+        if name not in STAGES:
+            print 'Unknown stage: %s' % name
+            sys.exit(1)
+    if options.jobs < 1 or options.repeat < 1:
+        print '--jobs and --repeat must be at least 1.'
+        sys.exit(1)
+    old = None
+    if options.compare is not None:
+        with open(options.compare, 'r') as fd:
+            old = json.load(fd)
+    work_dir = options.work_dir and os.path.abspath(options.work_dir)
+    if work_dir is None:
+        work_dir = tempfile.mkdtemp(prefix='warmup_stats_perf')
+    results = {'version': git_version(),
+               'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+               'python': sys.version.split()[0],
+               'platform': platform.platform(),
+               'argv': sys.argv,
+               'results': list()}
+    try:
+        for keys, pexecs, iterations in sizes:
+            print ('Benchmarking %d benchmark(s) x %d process execution(s) x %d '
+                   'iteration(s).' % (keys, pexecs, iterations))
+            directory = os.path.join(work_dir, '%dx%dx%d' % (keys, pexecs, iterations))
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+            stages = benchmark_size(keys, pexecs, iterations, options, directory)
+            results['results'].append({'size': [keys, pexecs, iterations], 'stages': stages})
+    finally:
+        if options.work_dir is None:
+            shutil.rmtree(work_dir)
+    if options.output is not None:
+        with open(options.output, 'w') as fd:
+            json.dump(results, fd, indent=4)
+        print 'Results written to: %s' % options.output
+    if old is not None and compare(old, results, options.threshold):
+        sys.exit(1)
+    if any(measured['status'] != 0 for size in results['results']
+           for measured in size['stages'].values()):
+        print 'Some stages did not run successfully.'
+        sys.exit(1)
@@ -6,6 +6,14 @@ set -e
 
 ./bin/mark_outliers_in_json -w 200 test/example1.json.bz2
 ./bin/mark_outliers_in_json -w 200 test/example2.json.bz2
+# Outliers can be marked without NumPy (e.g. under PyPy).
+NO_NUMPY=`mktemp -d`
+mkdir ${NO_NUMPY}/numpy
+echo 'raise ImportError("No module named numpy")' > ${NO_NUMPY}/numpy/__init__.py
+cp test/example1.json.bz2 ${NO_NUMPY}/
+env PYTHONPATH=${NO_NUMPY} ./bin/mark_outliers_in_json -w 200 ${NO_NUMPY}/example1.json.bz2
+cmp ${NO_NUMPY}/example1_outliers_w200.json.bz2 test/example1_outliers_w200.json.bz2
+rm -rf ${NO_NUMPY}
 ./bin/mark_changepoints_in_json -s 1500 test/example1_outliers_w200.json.bz2
 ./bin/mark_changepoints_in_json -s 1500 test/example2_outliers_w200.json.bz2
 ./bin/plot_krun_results --with-outliers --with-changepoints test/example1_outliers_w200_changepoints.json.bz2 -o test/plots1.pdf
@@ -13,3 +21,65 @@ set -e
 ./bin/table_classification_summaries_others test/example1_outliers_w200_changepoints.json.bz2 -o test/table1.tex
 ./bin/table_classification_summaries_others test/example2_outliers_w200_changepoints.json.bz2 -o test/table2.tex
 ./bin/diff_results -r test/example1_outliers_w200_changepoints.json.bz2 test/example2_outliers_w200_changepoints.json.bz2 --tex test/diff.tex
+# warmup_stats plots and diffs the results it holds in memory.
+WARMUP_STATS=`mktemp -d`
+cp test/example1.json.bz2 test/example2.json.bz2 ${WARMUP_STATS}/
+./bin/warmup_stats --output-plots ${WARMUP_STATS}/plots.pdf ${WARMUP_STATS}/example1.json.bz2 ${WARMUP_STATS}/example2.json.bz2
+./bin/warmup_stats --html --output-diff ${WARMUP_STATS}/diff.html ${WARMUP_STATS}/example1.json.bz2 ${WARMUP_STATS}/example2.json.bz2
+rm -rf ${WARMUP_STATS}
+# --watch summarises benchmarks whose process executions are all flat.
+WATCH=`mktemp -d`
+./test/gen_data.py --seed 4 --keys 2 --pexecs 3 --iterations 1000 --shapes flat ${WATCH}/flat.json.bz2
+./bin/warmup_stats --watch --watch-updates 1 --backend python --output-json ${WATCH}/flat.json ${WATCH}/flat.json.bz2 | grep 'flat (3 flat); steady .* from the start'
+rm -rf ${WATCH}
+# The Python changepoint backend should agree with R.
+cp test/example1_outliers_w200.json.bz2 test/example1py_outliers_w200.json.bz2
+./bin/mark_changepoints_in_json -s 1500 --backend python test/example1py_outliers_w200.json.bz2
+./test/compare_changepoints.py test/example1_outliers_w200_changepoints.json.bz2 test/example1py_outliers_w200_changepoints.json.bz2
+# ...including on data with real shifts: several shapes and process
+# executions, with and without outliers removed.
+./test/gen_data.py --seed 1 --keys 5 --pexecs 4 --iterations 1000 --shapes all test/shifts.json.bz2
+./test/gen_data.py --seed 2 --keys 5 --pexecs 4 --iterations 1000 --shapes all --outlier-rate 0.01 test/shiftso.json.bz2
+./bin/mark_outliers_in_json -w 200 test/shiftso.json.bz2
+cp test/shifts.json.bz2 test/shiftspy.json.bz2
+cp test/shiftso_outliers_w200.json.bz2 test/shiftsopy_outliers_w200.json.bz2
+./bin/mark_changepoints_in_json -s 500 test/shifts.json.bz2 test/shiftso_outliers_w200.json.bz2
+./bin/mark_changepoints_in_json -s 500 --backend python test/shiftspy.json.bz2 test/shiftsopy_outliers_w200.json.bz2
+./test/compare_changepoints.py --min-changepoints 10 test/shifts_changepoints.json.bz2 test/shiftspy_changepoints.json.bz2
+./test/compare_changepoints.py --min-changepoints 10 test/shiftso_outliers_w200_changepoints.json.bz2 test/shiftsopy_outliers_w200_changepoints.json.bz2
+# Segmenting a whole benchmark in one call into R (--r-batch) should give the
+# exact same results as segmenting each process execution separately.
+./test/check_r_backend.py test/example1_outliers_w200.json.bz2 test/example2_outliers_w200.json.bz2 test/shifts.json.bz2 test/shiftso_outliers_w200.json.bz2
+# Segmenting long process executions in overlapping windows (--chunk-size N,
+# overlapping by N/4 iterations by default) should find the same changepoints
+# as segmenting them whole, give or take N/8 iterations near window edges.
+./test/gen_data.py --seed 5 --keys 4 --pexecs 2 --iterations 8000 --shapes warmup,slowdown,'no steady state' test/long.json.bz2
+cp test/long.json.bz2 test/longchunked.json.bz2
+./bin/mark_changepoints_in_json -s 1000 --backend python test/long.json.bz2
+./bin/mark_changepoints_in_json -s 1000 --backend python --chunk-size 1000 test/longchunked.json.bz2
+./test/compare_changepoints.py --min-changepoints 10 --tolerance 125 test/long_changepoints.json.bz2 test/longchunked_changepoints.json.bz2
+# Reading input files through the results cache should not change the output,
+# even if run sequences mix integers and floats. The first run of each script
+# builds the cache, and the second reads from it.
+./test/gen_data.py --seed 3 --keys 5 --pexecs 4 --iterations 1000 --shapes all --outlier-rate 0.01 --integer-rate 0.0005 test/cached.json.bz2
+cp test/cached.json.bz2 test/uncached.json.bz2
+./bin/mark_outliers_in_json -w 200 test/uncached.json.bz2
+./bin/mark_outliers_in_json -w 200 --use-cache test/cached.json.bz2
+./bin/mark_outliers_in_json -w 200 --use-cache test/cached.json.bz2
+cmp test/uncached_outliers_w200.json.bz2 test/cached_outliers_w200.json.bz2
+./bin/mark_changepoints_in_json -s 500 --backend python test/uncached_outliers_w200.json.bz2
+./bin/mark_changepoints_in_json -s 500 --backend python --use-cache test/cached_outliers_w200.json.bz2
+./bin/mark_changepoints_in_json -s 500 --backend python --use-cache test/cached_outliers_w200.json.bz2
+cmp test/uncached_outliers_w200_changepoints.json.bz2 test/cached_outliers_w200_changepoints.json.bz2
+# Crashed process executions (which have no iterations) are not segmented or
+# classified, but the other process executions of their benchmarks still are.
+# Benchmarks whose first process execution crashed are not summarised.
+CRASHED=`mktemp -d`
+./test/gen_data.py --seed 9 --keys 3 --pexecs 4 --iterations 1000 --shapes all --crash-rate 0.3 ${CRASHED}/crashed.json.bz2
+./bin/mark_outliers_in_json -w 200 ${CRASHED}/crashed.json.bz2
+cp ${CRASHED}/crashed_outliers_w200.json.bz2 ${CRASHED}/crashedpy_outliers_w200.json.bz2
+./bin/mark_changepoints_in_json -s 500 ${CRASHED}/crashed_outliers_w200.json.bz2
+./bin/mark_changepoints_in_json -s 500 --backend python ${CRASHED}/crashedpy_outliers_w200.json.bz2
+./bin/warmup_stats --backend python --output-json ${CRASHED}/summary.json ${CRASHED}/crashed.json.bz2
+./bin/diff_results -r ${CRASHED}/crashed_outliers_w200_changepoints.json.bz2 ${CRASHED}/crashedpy_outliers_w200_changepoints.json.bz2 -j ${CRASHED}/diff.json --html ${CRASHED}/diff.html
+rm -rf ${CRASHED}
@@ -92,7 +92,13 @@ def bootstrap_steady_perf(steady_segments_all_pexecs, confidence_level=CONFIDENC
         sys.stderr.write("Unknown quality level '%s'" % quality)
         sys.exit(1)
     means.sort()
+    return median_ci(means, confidence_level)
 
+
+def median_ci(means, confidence_level=CONFIDENCE_LEVEL):
+    """Return the median and confidence interval of a sorted list of
+    bootstrapped means.
+    """
     # Compute reported mean and confidence interval. Code below is from libkalibera.
     assert not isinstance(confidence_level, float)
     confidence_level = Decimal(confidence_level)
@@ -0,0 +1,479 @@
+"""Segment run sequences at their changepoints, and classify them.
+
+Changepoints can be found by the R changepoint library (through rpy2), or
+by a native implementation of the same algorithm (see warmup.pelt). R and
+rpy2 are imported only when the R backend is used. Note that R_LIBS_USER
+must include the location of the changepoint library before R is first
+used (see bin/mark_changepoints_in_json).
+"""
+
+import bisect
+import numpy
+
+from warmup import profiling
+from warmup.pelt import crops_meanvar_norm, optimal_partition_meanvar_norm, pelt_meanvar_norm
+from warmup.pelt import segment_means_variances
+from warmup.pelt import VERSION as PELT_VERSION
+from warmup.statistics import get_absolute_delta_using_fastest_seg
+
+BACKENDS = ['r', 'python']
+# Default penalty for each changepoint, as a multiple of the log of the number
+# of iterations in the run sequence (excluding outliers).
+PENALTY = 15.0
+# Fields which hold the segmentation of each process execution. Unlike its
+# classification, the segmentation does not depend on the delta, steady state
+# or raw deltas options.
+SEGMENTATION_FIELDS = ['changepoints', 'changepoint_means', 'changepoint_vars']
+# Fields written into Krun results files by mark_changepoints_in_json.
+CHANGEPOINT_FIELDS = SEGMENTATION_FIELDS + ['classifications']
+# Field which holds the penalty sweep of each process execution (see
+# get_penalty_sweeps_all()), if one was requested.
+SWEEP_FIELD = 'changepoint_sweeps'
+
+
+class Segment(object):
+    """A single segment between two changepoints.
+    """
+
+    def __init__(self, start, end, mean, variance, data, outliers):
+        self.start = start
+        self.end = end
+        self.mean = mean
+        self.variance = variance
+        self.data = data
+
+    @property
+    def n(self):
+        return self.end - self.start
+
+
+class Segments(object):
+    """A list of Segments for a whole run sequence.
+    """
+
+    def __init__(self, delta, steady_state, length, cpts, means, variances,
+                 data, outliers, raw_deltas):
+        self.delta = delta
+        # When True, the variance not used when finding "equivalent" segments.
+        self.raw_deltas = raw_deltas
+        self.steady_state = steady_state
+        self.length = length  # Length of original data with outliers.
+        assert self.length == len(data)
+        self.data = data
+        self.outliers = outliers
+        self.segments = list()
+        assert len(means) == len(variances) == len(cpts)
+        if len(means) == 1:  # No changepoints.
+            segment = Segment(0, self.length - 1, means[0], variances[0], data,
+                              outliers)
+            self.segments.append(segment)
+        else:
+            for index in xrange(len(means)):
+                segment = None
+                if index == 0:
+                    s_out = [out for out in outliers if out <= cpts[index]]
+                    segment = Segment(0, cpts[index], means[index],
+                                  variances[index], data[:cpts[index]+1], s_out)
+                else:
+                    s_out = list()
+                    for out in outliers:
+                         if out > (cpts[index - 1]) and out <= cpts[index]:
+                             s_out.append(out - cpts[index - 1] - 1)
+                    segment = Segment(cpts[index - 1], cpts[index],
+                                  means[index], variances[index],
+                                  data[cpts[index - 1]+1:cpts[index]+1], s_out)
+                self.segments.append(segment)
+        assert cpts[:-1] == [s.end for s in self.segments][:-1]
+
+    @property
+    def means(self):
+        return [segment.mean for segment in self.segments]
+
+    @property
+    def variances(self):
+        return [segment.variance for segment in self.segments]
+
+    @property
+    def changepoints(self):
+        """Return all changepoints.
+        The last location in the data is always a changepoint, so we ignore it.
+        """
+        if len(self.segments) == 1:
+            return list()
+        return [segment.end for segment in self.segments][:-1]
+
+    def get_classification(self):
+        """Return a classification for this run sequence."""
+        last_segment = self.segments[-1]
+        delta = get_absolute_delta_using_fastest_seg(
+            self.delta, [s.mean for s in self.segments])
+
+        if self.raw_deltas:
+            lower_bound = last_segment.mean - delta
+            upper_bound = last_segment.mean + delta
+        else:
+            lower_bound = min(last_segment.mean - last_segment.variance,
+                              last_segment.mean - delta)
+            upper_bound = max(last_segment.mean + last_segment.variance,
+                              last_segment.mean + delta)
+
+        classification = 'flat'
+        for index in xrange(len(self.segments) - 2, -1, -1):
+            current_segment = self.segments[index]
+            if (current_segment.mean + current_segment.variance >= lower_bound and
+                    current_segment.mean - current_segment.variance <= upper_bound):
+                continue
+            elif current_segment.end > (self.length - self.steady_state):
+                classification = 'no steady state'
+                break
+            elif current_segment.mean - current_segment.variance < lower_bound:
+                classification = 'slowdown'
+                break
+            assert current_segment.mean + current_segment.variance > upper_bound
+            classification = 'warmup'
+        return classification
+
+
+def _remove_outliers(data, outliers):
+    """Return data, as a NumPy array, without the iterations whose indices are
+    listed in outliers.
+    """
+    keep = numpy.ones(len(data), dtype=bool)
+    keep[numpy.asarray(outliers, dtype=int)] = False
+    return numpy.asarray(data, dtype=numpy.float64)[keep]
+
+
+def _restore_indices(c_points, outliers):
+    """Map indices into a run sequence whose outliers were removed (see
+    _remove_outliers()) back to indices into the original run sequence.
+    """
+    outliers = numpy.unique(numpy.asarray(outliers, dtype=int))
+    # Once the outliers before it are removed, the nth outlier would be at
+    # index outliers[n] - n. Every index at or after that moves along by one.
+    shifts = numpy.searchsorted(outliers - numpy.arange(len(outliers)), c_points,
+                                side='right')
+    return [int(c_point) for c_point in numpy.asarray(c_points, dtype=int) + shifts]
+
+
+def _cpt_meanvar(cpt, p_exec, penalty):
+    """Segment a run sequence (a NumPy array) with the R changepoint library.
+    Returns a tuple of (changepoints, means, variances), where changepoints are
+    1-indexed, as in R.
+    """
+    import rpy2.robjects
+    changepoints = cpt.cpt_meanvar(rpy2.robjects.FloatVector(p_exec.tolist()), method='PELT',
+                                   penalty='Manual', pen_value=penalty)
+    param_est = changepoints.slots['param.est']
+    return ([float(cpoint) for cpoint in changepoints.slots['cpts']],
+            [float(mean) for mean in param_est[param_est.names.index('mean')]],
+            [float(var_) for var_ in param_est[param_est.names.index('variance')]])
+
+
+# Apply cpt.meanvar() to a list of run sequences, each with its own penalty,
+# so that a whole benchmark is segmented in a single call into R. numpy2ri
+# makes each run sequence a 1-dimensional R array, which cpt.meanvar() would
+# treat as a matrix, so its dim attribute is dropped with as.numeric().
+_R_CPT_MEANVAR_ALL = """
+function(p_execs, penalties) {
+    mapply(function(p_exec, penalty) {
+        result <- changepoint::cpt.meanvar(as.numeric(p_exec), method='PELT',
+                                           penalty='Manual', pen.value=penalty)
+        list(result@cpts, result@param.est$mean, result@param.est$variance)
+    }, p_execs, penalties, SIMPLIFY=FALSE)
+}
+"""
+_R_FUNCTIONS = dict()  # Name -> R function, defined when first needed.
+
+
+def _cpt_meanvar_all(p_execs, penalties):
+    """Segment each of a list of run sequences (NumPy arrays) with the R
+    changepoint library. Returns a list of (changepoints, means, variances)
+    tuples, where changepoints are 1-indexed, as in R.
+    """
+    import rpy2.robjects
+    import rpy2.robjects.numpy2ri
+    if 'cpt_meanvar_all' not in _R_FUNCTIONS:
+        _R_FUNCTIONS['cpt_meanvar_all'] = rpy2.robjects.r(_R_CPT_MEANVAR_ALL)
+    # numpy2ri copies each array into R from its buffer, rather than element
+    # by element.
+    r_p_execs = rpy2.robjects.r['list'](*[rpy2.robjects.numpy2ri.numpy2ri(p_exec)
+                                          for p_exec in p_execs])
+    results = _R_FUNCTIONS['cpt_meanvar_all'](r_p_execs, rpy2.robjects.FloatVector(penalties))
+    return [([float(cpoint) for cpoint in result[0]], [float(mean) for mean in result[1]],
+             [float(var_) for var_ in result[2]]) for result in results]
+
+
+def get_segments_all(cpt, delta, steady_state, p_execs, all_outliers, raw_deltas,
+                     penalty=PENALTY, r_batch=False):
+    """Segment each of a list of run sequences, excluding the outliers listed
+    in the corresponding element of all_outliers, and return a list of
+    Segments. cpt is the R changepoint library, or None to use the native
+    Python implementation of PELT. R is called once for each run sequence,
+    unless r_batch is True, in which case it is called once for the whole
+    list (see test/check_r_backend.py).
+    """
+    kept = [_remove_outliers(data, outliers) for data, outliers in zip(p_execs, all_outliers)]
+    penalties = [penalty * numpy.log(len(p_exec)) for p_exec in kept]
+    if cpt is None:
+        results = list()
+        for p_exec, pen_value in zip(kept, penalties):
+            r_cpts = pelt_meanvar_norm(p_exec, pen_value)
+            results.append((r_cpts,) + segment_means_variances(p_exec.tolist(), r_cpts))
+    elif r_batch:
+        results = _cpt_meanvar_all(kept, penalties)
+    else:
+        results = [_cpt_meanvar(cpt, p_exec, pen_value)
+                   for p_exec, pen_value in zip(kept, penalties)]
+    all_segments = list()
+    for data, outliers, (r_cpts, means, variances) in zip(p_execs, all_outliers, results):
+        # List indices in R start at 1. If outliers were removed, the index
+        # of each changepoint will have moved, so we adjust the indices to
+        # match the original data.
+        c_points = _restore_indices([int(cpoint - 1) for cpoint in r_cpts], outliers)
+        all_segments.append(Segments(delta, steady_state, len(data), c_points, means,
+                                     variances, data, outliers, raw_deltas))
+    return all_segments
+
+
+def get_segments(cpt, delta, steady_state, data, outliers, raw_deltas, penalty=PENALTY):
+    """Segment a run sequence, excluding outliers. cpt is the R changepoint
+    library, or None to use the native Python implementation of PELT.
+    """
+    return get_segments_all(cpt, delta, steady_state, [data], [outliers], raw_deltas,
+                            penalty)[0]
+
+
+def get_penalty_sweeps_all(p_execs, all_outliers, penalty_range):
+    """Find the optimal segmentations of each of a list of run sequences,
+    excluding outliers, for every penalty in penalty_range, a (minimum,
+    maximum) pair of multiples of the log of the length of the run sequence
+    (as for the penalty of get_segments_all()), with the native Python
+    implementation of CROPS.
+
+    Returns a sweep for each run sequence: a dictionary holding a list of
+    penalties, in increasing order, and a list of the changepoints of the
+    segmentation which is optimal from each penalty up to the next. Sweeps
+    can be stored in Krun results files, and a segmentation picked from them
+    later, with select_penalty(). PELT's pruning is not always exact, so a
+    segmentation picked from a sweep can occasionally differ from (and fit
+    better than) the one found by get_segments_all() for the same penalty.
+    """
+    kept = [_remove_outliers(data, outliers) for data, outliers in zip(p_execs, all_outliers)]
+    scales = [numpy.log(len(p_exec)) for p_exec in kept]
+    envelopes = [crops_meanvar_norm(p_exec, penalty_range[0] * scale, penalty_range[1] * scale)
+                 for p_exec, scale in zip(kept, scales)]
+    sweeps = list()
+    for outliers, scale, envelope in zip(all_outliers, scales, envelopes):
+        # As with Segments.changepoints, the end of the data is omitted.
+        sweeps.append({'penalties': [float(penalty / scale) for penalty, _ in envelope],
+                       'changepoints': [_restore_indices([cpoint - 1 for cpoint in cpts[:-1]],
+                                                         outliers)
+                                        for _, cpts in envelope]})
+    return sweeps
+
+
+def select_penalty(data, outliers, sweep, penalty):
+    """Return the changepoints, segment means and variances of a run sequence
+    which are optimal for penalty, picked from a sweep returned by
+    get_penalty_sweeps_all(), without running the changepoint analysis again.
+    Raises ValueError if penalty is below the range of the sweep.
+    """
+    index = bisect.bisect_right(sweep['penalties'], penalty) - 1
+    if index < 0:
+        raise ValueError('Penalty %g is below the range of the penalty sweep.' % penalty)
+    changepoints = sweep['changepoints'][index]
+    p_exec = _remove_outliers(data, outliers)
+    # Changepoints are never outliers, so each moves back by the number of
+    # outliers before it.
+    sorted_outliers = numpy.unique(numpy.asarray(outliers, dtype=int))
+    r_cpts = [int(cpoint) + 1 for cpoint in numpy.asarray(changepoints, dtype=int) -
+              numpy.searchsorted(sorted_outliers, changepoints)]
+    means, variances = segment_means_variances(p_exec.tolist(), r_cpts + [len(p_exec)])
+    return list(changepoints), means, variances
+
+
+def chunk_windows(length, chunk_size, overlap):
+    """Split a run sequence of length iterations into windows of chunk_size
+    iterations, each overlapping the next by at least overlap iterations.
+    Returns a list of (start, end) pairs.
+    """
+    if length <= chunk_size:
+        return [(0, length)]
+    starts = range(0, length - chunk_size + 1, chunk_size - overlap)
+    if starts[-1] + chunk_size < length:
+        starts.append(length - chunk_size)
+    return [(start, start + chunk_size) for start in starts]
+
+
+def get_chunk_jobs(data, outliers, chunk_size, overlap, penalty=PENALTY):
+    """Split a run sequence, excluding outliers, into overlapping windows (see
+    chunk_windows()), which can be segmented independently by
+    window_worker(). Returns a list of jobs for window_worker(), and a list
+    of the start of each window, for reconcile_chunks().
+
+    Each window is penalised as the whole run sequence would be, so that
+    changepoints within a window are found as they would be in the whole.
+    """
+    p_exec = _remove_outliers(data, outliers)
+    pen_value = penalty * numpy.log(len(p_exec))
+    windows = chunk_windows(len(p_exec), chunk_size, overlap)
+    return ([(p_exec[start:end], pen_value) for start, end in windows],
+            [start for start, _ in windows])
+
+
+def reconcile_chunks(delta, steady_state, data, outliers, starts, all_cpts, raw_deltas,
+                     penalty=PENALTY):
+    """Return the Segments of a run sequence whose windows (see
+    get_chunk_jobs()), starting at starts, were segmented independently, with
+    the changepoints all_cpts. Changepoints found near the edge of one window
+    may be missing, or misplaced, in the next. The segmentation returned is
+    the optimal segmentation of the whole run sequence whose changepoints are
+    all among those found in any window, so duplicates are merged and
+    spurious changepoints dropped.
+
+    The result matches the segmentation of the whole run sequence whenever
+    each of its changepoints is found by some window. A changepoint may be
+    missed only if it is near the edge of every window that contains it, so
+    the larger the overlap, the less likely a difference. On generated data
+    (20000 iterations, windows of 2000), overlaps of 100 iterations or more
+    gave identical results, and no overlap at all changed about half of the
+    segmentations.
+    """
+    p_exec = _remove_outliers(data, outliers)
+    candidates = set([len(p_exec)])
+    for start, cpts in zip(starts, all_cpts):
+        # The last changepoint of each window is only the end of that window.
+        candidates.update(start + cpoint for cpoint in cpts[:-1])
+    r_cpts = optimal_partition_meanvar_norm(p_exec, penalty * numpy.log(len(p_exec)),
+                                            sorted(candidates))
+    means, variances = segment_means_variances(p_exec.tolist(), r_cpts)
+    c_points = _restore_indices([cpoint - 1 for cpoint in r_cpts], outliers)
+    return Segments(delta, steady_state, len(data), c_points, means, variances, data,
+                    outliers, raw_deltas)
+
+
+def _stored_segments(delta, steady_state, data, outliers, changepoints, means, variances,
+                     raw_deltas):
+    """Return the Segments of a run sequence, given changepoints as stored in
+    Krun results files.
+    """
+    # Stored changepoints omit the end of the last segment, which does not
+    # affect the classification.
+    return Segments(delta, steady_state, len(data), changepoints + [len(data) - 1],
+                    means, variances, data, outliers, raw_deltas)
+
+
+def classify_segmentation(delta, steady_state, data, outliers, changepoints, means,
+                          variances, raw_deltas):
+    """Classify a run sequence which has already been segmented, e.g. by an
+    earlier call of get_segments() whose changepoints, means and variances
+    were stored in a Krun results file. Returns None if the run sequence
+    cannot be classified.
+    """
+    segments = _stored_segments(delta, steady_state, data, outliers, changepoints, means,
+                                variances, raw_deltas)
+    try:
+        return segments.get_classification()
+    except ValueError:
+        return None
+
+
+# Per-process state of segments_worker() processes.
+_WORKER = dict()
+
+
+def import_changepoint(backend):
+    """Return the R changepoint library if backend is 'r', or None for the
+    native Python backend (see get_segments()).
+    """
+    if backend == 'r':
+        import rpy2.interactive.packages
+        return rpy2.interactive.packages.importr('changepoint')
+    return None
+
+
+def backend_version(backend):
+    """Return a description of the changepoint implementation used by
+    backend, after checking that R and its changepoint library (if needed)
+    are recent enough.
+    """
+    if backend == 'r':
+        from rpy2.rinterface import R_VERSION_BUILD
+        cpt = import_changepoint(backend)
+        r_version = '.'.join(R_VERSION_BUILD[:2])
+        assert cpt.__version__ >= '2.2.2', 'Please update the changepoint library.'
+        assert r_version >= '3.3.1', 'Please update R from CRAN.'
+        return 'R version %s and changepoint library %s' % (r_version, cpt.__version__)
+    return 'native PELT implementation %s with NumPy %s' % (PELT_VERSION, numpy.__version__)
+
+
+def init_segments_worker(backend, delta, steady_state, raw_deltas, penalty=PENALTY,
+                         penalty_range=None, r_batch=False):
+    """Initialise a worker process. With the R backend, each worker owns its
+    own instance of the R changepoint library. r_batch is as for
+    get_segments_all().
+    """
+    _WORKER['cpt'] = import_changepoint(backend)
+    _WORKER['delta'] = delta
+    _WORKER['steady_state'] = steady_state
+    _WORKER['raw_deltas'] = raw_deltas
+    _WORKER['penalty'] = penalty
+    _WORKER['penalty_range'] = penalty_range
+    _WORKER['r_batch'] = r_batch
+
+
+def segments_worker(jobs):
+    """Segment and classify a list of process executions (with the R backend
+    and r_batch, in one call into R). jobs is a list of (p_exec, outliers) tuples. Returns
+    a tuple of (results, profile), where results holds a tuple of
+    (changepoints, means, variances, classification, sweep) for each job, with
+    a classification of None if the process execution could not be
+    classified, and a sweep of None unless a penalty range was given to
+    init_segments_worker(). profile holds the records of warmup.profiling (or
+    is None if profiling is disabled).
+    """
+    p_execs = [p_exec for p_exec, _ in jobs]
+    all_outliers = [outliers for _, outliers in jobs]
+    results = list()
+    with profiling.capture() as profile:
+        with profiling.stage('changepoints'):
+            if _WORKER['penalty_range'] is None:
+                all_segments = get_segments_all(_WORKER['cpt'], _WORKER['delta'],
+                                                _WORKER['steady_state'], p_execs, all_outliers,
+                                                _WORKER['raw_deltas'], _WORKER['penalty'],
+                                                _WORKER['r_batch'])
+                sweeps = [None] * len(jobs)
+            else:
+                sweeps = get_penalty_sweeps_all(p_execs, all_outliers, _WORKER['penalty_range'])
+                all_segments = list()
+                for p_exec, outliers, sweep in zip(p_execs, all_outliers, sweeps):
+                    changepoints, means, variances = select_penalty(p_exec, outliers, sweep,
+                                                                    _WORKER['penalty'])
+                    all_segments.append(_stored_segments(_WORKER['delta'],
+                                                         _WORKER['steady_state'], p_exec,
+                                                         outliers, changepoints, means,
+                                                         variances, _WORKER['raw_deltas']))
+        for segments, sweep in zip(all_segments, sweeps):
+            with profiling.stage('classification'):
+                try:
+                    classification = segments.get_classification()
+                except ValueError:
+                    classification = None
+            results.append((segments.changepoints, segments.means, segments.variances,
+                            classification, sweep))
+    return results, profile
+
+
+def window_worker(job):
+    """Segment one window of a long run sequence (see get_chunk_jobs()) with
+    the native Python implementation of PELT. job is a tuple of (window,
+    pen_value), where pen_value is the penalty for each changepoint. Returns a
+    tuple of (cpts, profile), where cpts are the 1-indexed changepoints of the
+    window, as returned by pelt_meanvar_norm(), and profile is as for
+    segments_worker().
+    """
+    window, pen_value = job
+    with profiling.capture() as profile:
+        with profiling.stage('changepoints'):
+            cpts = pelt_meanvar_norm(window, pen_value)
+    return [int(cpoint) for cpoint in cpts], profile
@@ -0,0 +1,590 @@
+"""Diff the summary statistics of two sets of Krun results (already
+annotated with outliers and changepoints), and write the diff as an HTML
+or LaTeX table.
+
+Confidence intervals for the classifications are computed by the R
+MultinomialCI library (through rpy2), which is imported on first use.
+Note that R_LIBS_USER must include the location of the library before R
+is first used (see bin/diff_results).
+"""
+
+import collections
+import json
+import math
+import numpy
+
+from warmup.latex import end_document, end_longtable, end_table, escape
+from warmup.latex import get_latex_symbol_map, preamble
+from warmup.latex import start_longtable, start_table, STYLE_SYMBOLS
+from warmup.summary_statistics import BLANK_CELL, collect_summary_statistics
+from warmup.summary_statistics import convert_to_latex, write_html_table
+
+ALPHA = 0.01  # Significance level.
+CI_MINIUM_SIGNIFICANT_NARROWING = 0.0001 # In seconds
+CATEGORIES = ['warmup', 'slowdown', 'flat', 'no steady state']
+# List indices (used in favour of dictionary keys).
+CLASSIFICATIONS = 0  # Indices for top-level summary lists.
+STEADY_ITER = 1
+STEADY_ITER_VAR = 2
+STEADY_STATE_TIME = 3
+STEADY_STATE_TIME_VAR = 4
+INTERSECTION = 5
+SAME = 0  # Indices for nested lists.
+DIFFERENT = 1
+BETTER = 2
+WORSE = 3
+SKIPPED_BEFORE = 0
+SKIPPED_AFTER = 1
+# Dictionary keys
+BEFORE = 'before'
+AFTER = 'after'
+CLASSIFIER = 'classifier'
+DIFF = 'diff'
+SKIPPED = 'skipped'
+# LaTeX output.
+TITLE = 'Summary of benchmark classifications'
+TABLE_FORMAT = ('ll@{\hspace{0cm}}ll@{\hspace{0cm}}r@{\hspace{.4cm}}r@{\hspace{.4cm}}r@{\hspace{.4cm}}r@{\hspace{.4cm}}'
+                'l@{\hspace{.4cm}}ll@{\hspace{.4cm}}r@{\hspace{.4cm}}r@{\hspace{.4cm}}rr@{\hspace{.4cm}}r')
+TABLE_HEADINGS_START1 = '\\multicolumn{1}{c}{\\multirow{2}{*}{}}&'
+TABLE_HEADINGS_START2 = '&'
+TABLE_HEADINGS1 = ('&&\\multicolumn{1}{c}{} &\\multicolumn{1}{c}{Steady} &\\multicolumn{1}{c}{Steady iter.} '
+                   '&\\multicolumn{1}{c}{Steady} &\\multicolumn{1}{c}{Steady} &\\multicolumn{1}{c}{Steady perf.}')
+TABLE_HEADINGS2 = ('&&\\multicolumn{1}{c}{Class.} &\\multicolumn{1}{c}{iter (\#)} &\\multicolumn{1}{c}{variation (s)} '
+                   '&\\multicolumn{1}{c}{iter (s)} &\\multicolumn{1}{c}{perf (s)} &\\multicolumn{1}{c}{variation (s)}')
+
+JSON_VERSION_NUMBER = '2'
+# R packages, imported by _multinomial_ci() on first use.
+_R_PACKAGES = dict()
+
+
+def legend():
+    table = """\\begin{tabular}{l|l|l|l}
+\\multicolumn{1}{c}{%s} & \\multicolumn{1}{c}{%s} & \\multicolumn{1}{c}{%s} & \\multicolumn{1}{c}{%s} \\\\
+\\end{tabular}
+""" % (colour_tex_cell(BETTER, 'improved'),
+       colour_tex_cell(WORSE, 'worsened'),
+       colour_tex_cell(DIFFERENT, 'different'),
+       colour_tex_cell(SAME, 'unchanged'))
+    return '\\textbf{Diff against previous results:} ' + table
+
+
+def do_intervals_differ((x1, y1), (x2, y2)):
+    """Given two IQRs or CIs return True if they do NOT overlap."""
+
+    assert y1 >= x1 and y2 >= x2
+    return y1 < x2 or y2 < x1
+
+
+def does_interval_narrow((x1, y1), (x2, y2)):
+    """Return True if the second interval is narrower than the first."""
+
+    assert y1 >= x1 and y2 >= x2
+    # Sometimes there is no variation in a dataset (more likely for steady iter
+    # than steady perf, for obvious reasons). So, we check for special cases,
+    # rather than causing a divide by zero.
+    diff1, diff2 = y1 - x1, y2 - x2
+    if diff1 == 0 and diff2 == 0:
+        return SAME
+    if diff1 == 0 and diff2 > 0:
+        return WORSE
+    ratio = float(diff2) / float(diff1)
+    if ratio == 1.0:
+        return SAME
+    elif ratio < 1.0:
+        return BETTER
+    return WORSE
+
+
+def do_mean_cis_differ(mean1, ci1, mean2, ci2):
+    """Given two means +/- CIs return True if they do NOT overlap."""
+
+    assert ci1 >= 0.0 and ci2 >= 0.0, 'Found negative confidence interval from bootstrapping.'
+    x1 = mean1 - ci1
+    y1 = mean1 + ci1
+    x2 = mean2 - ci2
+    y2 = mean2 + ci2
+    return do_intervals_differ((x1, y1), (x2, y2))
+
+
+def does_ci_narrow(mean1, ci1, mean2, ci2):
+    """Return True if the second interval is narrower than the first."""
+
+    assert ci1 >= 0.0 and ci2 >= 0.0, 'Found negative confidence interval from bootstrapping.'
+    if abs(ci1 - ci2) < CI_MINIUM_SIGNIFICANT_NARROWING:
+        return SAME
+    x1 = mean1 - ci1
+    y1 = mean1 + ci1
+    x2 = mean2 - ci2
+    y2 = mean2 + ci2
+    return does_interval_narrow((x1, y1), (x2, y2))
+
+
+def all_flat(classifications):
+    """Return True if all pexecs in a detailed classification dict are 'flat'."""
+
+    return (classifications['warmup'] == 0 and classifications['slowdown'] == 0
+            and classifications['no steady state'] == 0)
+
+
+def all_nss(classifications):
+    """Return True if all pexecs in a detailed classification dict are 'no steady state'."""
+
+    return (classifications['warmup'] == 0 and classifications['slowdown'] == 0 and
+            classifications['flat'] == 0)
+
+
+def any_nss(classifications):
+    """Return True if any pexec in a detailed classification dict is 'no steady state'."""
+
+    return classifications['no steady state'] > 0
+
+
+def _rewrite_key(key, diff_vms):
+    """Rewrite a bench:vm:language key.
+    Takes as arguments one key, and a list of two VM names, that the user wants
+    to compare - ['VM1', 'VM2']. Rewrites the key from 'bench:vm:language' to
+    'bench:VM1 vs. VM2:language'.
+
+    By default, the differ compares all VMs that appear in one results file
+    against results from the same the same VM in a second file. When the user
+    wants to compare one VM against another, this renaming fools the differ
+    into thinking that the two different VMs are the same. We choose the name
+    'VM1 vs. VM2' since that is the text we wish to appear in the output tables.
+    """
+
+    split = key.split(':')
+    combined_vm = ' vs. '.join(diff_vms)
+    return ':'.join([split[0], combined_vm, split[2]])
+
+
+def _rewrite_vm_keys(results, vm, diff_vms):
+    """Return a copy of results (from one machine) in which every key which
+    names vm is rewritten by _rewrite_key(), or None if vm was not found.
+    The results themselves are not modified.
+    """
+
+    rewritten = dict(results)
+    found_vm = False
+    for dtype in results:
+        if isinstance(results[dtype], collections.Iterable):
+            for key in list(results[dtype]):
+                if vm in key:
+                    found_vm = True
+                    if rewritten[dtype] is results[dtype]:
+                        rewritten[dtype] = dict(results[dtype])
+                    new_key = _rewrite_key(key, diff_vms)
+                    rewritten[dtype][new_key] = rewritten[dtype].pop(key)
+    if not found_vm:
+        return None
+    return rewritten
+
+
+def _multinomial_ci(counts):
+    """Return simultaneous confidence intervals (at significance level ALPHA)
+    for the proportion of pexecs in each category, given the count of each.
+    """
+
+    if 'MultinomialCI' not in _R_PACKAGES:
+        import rpy2.interactive.packages
+        _R_PACKAGES['MultinomialCI'] = rpy2.interactive.packages.importr('MultinomialCI')
+    import rpy2.robjects
+    mci = _R_PACKAGES['MultinomialCI']
+    return numpy.array(mci.multinomialCI(rpy2.robjects.FloatVector(counts), ALPHA))
+
+
+def _skipped(results, summary, machine, key):
+    """Return True if key was skipped when results (from one machine) were
+    summarised: either it has no classifications, or it has no summary (e.g.
+    because its first process execution crashed).
+    """
+
+    if len(results[machine]['classifications'].get(key, [])) == 0:
+        return True
+    bench, vm = key.split(':')[:-1]
+    return bench not in summary['machines'][machine].get(vm, {})
+
+
+def diff(before, after, summary_filename, diff_vms=[]):
+    """Diff two sets of results, each a (classifier, data dictionary) pair, as
+    returned by merge_krun_results_with_changepoints(), and write the diff
+    summary to summary_filename. The results are not modified. Raises
+    ValueError if diff_vms names a VM which is not in the results.
+    """
+
+    classifiers = dict()
+    # In the JSON dump, we need the diff, and  the original summaries of the
+    # before / after results, so that they can be written into a LaTeX table.
+    summary = {DIFF: dict(), SKIPPED: [[], []], BEFORE: None, AFTER: None, CLASSIFIER: None}
+    classifiers[BEFORE], before_results = before
+    classifiers[AFTER], after_results = after
+    assert len(before_results.keys()) == 1, 'Expected one machine per results file.'
+    assert len(after_results.keys()) == 1, 'Expected one machine per results file.'
+    assert before_results.keys()[0] == after_results.keys()[0], 'Expected results to be from same machine.'
+    machine = before_results.keys()[0]
+    # Special case: the user wants to diff one VM against another (by default,
+    # we diff each VM against itself, for every VM that appears in both the
+    # before and after data). If the user wants to diff one VM against another,
+    # then we rename the "before" and "after" VMs to these special names, and
+    # rename them back before presenting the diff results back to the user. This
+    # is an unpleasant hack, but since the diff information is baked into the
+    # structure of the summary diff, improving this code (and the LaTeX / HTML
+    # output code) would be a significant task.
+    if diff_vms:
+        before_vm, after_vm = diff_vms
+        before_machine = _rewrite_vm_keys(before_results[machine], before_vm, diff_vms)
+        if before_machine is None:
+            raise ValueError('Could not find requested VM in results data: ' + before_vm)
+        after_machine = _rewrite_vm_keys(after_results[machine], after_vm, diff_vms)
+        if after_machine is None:
+            raise ValueError('Could not find requested VM in results data: ' + after_vm)
+        before_results = {machine: before_machine}
+        after_results = {machine: after_machine}
+    summary[BEFORE] = collect_summary_statistics(before_results,
+                                                 classifiers[BEFORE]['delta'], classifiers[BEFORE]['steady'])
+    summary[AFTER] = collect_summary_statistics(after_results,
+                                                classifiers[AFTER]['delta'], classifiers[AFTER]['steady'])
+    for key in classifiers[BEFORE]:
+        assert classifiers[BEFORE][key] == classifiers[AFTER][key], \
+            'Results files generated with different values for %s' % key
+    summary[CLASSIFIER] = classifiers[AFTER]
+    # Generate CIs for DEFAULT_ITER classification data.
+    before_class_cis = dict()
+    for key in before_results[machine]['classifications']:
+        if _skipped(before_results, summary[BEFORE], machine, key):
+            continue
+        class_counts = [before_results[machine]['classifications'][key].count(category) for category in CATEGORIES]
+        before_class_cis[key] = _multinomial_ci(class_counts)
+    for key in after_results[machine]['classifications']:
+        if _skipped(after_results, summary[AFTER], machine, key):
+            continue
+        if key in before_results[machine]['classifications']:
+            bench, vm = key.split(':')[:-1]
+            if vm not in summary[DIFF]:
+                summary[DIFF][vm] = dict()
+            summary[DIFF][vm][bench] = [None, None, None, None, None, None]
+    for key in after_results[machine]['classifications']:
+        bench, vm = key.split(':')[:-1]
+        # Deal with skipped benchmarks.
+        if _skipped(before_results, summary[BEFORE], machine, key):
+            summary[SKIPPED][SKIPPED_BEFORE].append((bench, vm))
+            continue
+        elif _skipped(after_results, summary[AFTER], machine, key):
+            summary[SKIPPED][SKIPPED_AFTER].append((bench, vm))
+            continue
+        # Classifications are available, whether or not summary statistics can be generated.
+        trunc_cat = [summary[AFTER]['machines'][machine][vm][bench]['process_executons'][p]['classification'] \
+                     for p in xrange(len(summary[AFTER]['machines'][machine][vm][bench]['process_executons']))]
+        trunc_counts = [trunc_cat.count(category) for category in CATEGORIES]
+        after_class_cis = _multinomial_ci(trunc_counts)
+        sample = summary[AFTER]['machines'][machine][vm][bench]
+        base_case = summary[BEFORE]['machines'][machine][vm][bench]
+        for category in CATEGORIES:
+            cat_index = CATEGORIES.index(category)
+            if do_intervals_differ(before_class_cis[key][cat_index], after_class_cis[cat_index]):
+                if (sample['detailed_classification']['warmup'] + sample['detailed_classification']['flat'] >
+                        base_case['detailed_classification']['warmup'] + base_case['detailed_classification']['flat']):
+                    summary[DIFF][vm][bench][CLASSIFICATIONS] = BETTER
+                    break
+                elif (sample['detailed_classification']['no steady state'] + sample['detailed_classification']['slowdown'] >
+                        base_case['detailed_classification']['no steady state'] + base_case['detailed_classification']['slowdown']):
+                    summary[DIFF][vm][bench][CLASSIFICATIONS] = WORSE
+                    break
+                else:
+                    summary[DIFF][vm][bench][CLASSIFICATIONS] = DIFFERENT
+                    break
+        else:
+            summary[DIFF][vm][bench][CLASSIFICATIONS] = SAME
+        # If the CIs did not overlap, but the ONLY difference is in the number
+        # of warmups / flats, we say the results were the same (because we see
+        # warmups / flats are the same case).
+        if summary[DIFF][vm][bench][CLASSIFICATIONS] != SAME and \
+                base_case['detailed_classification']['slowdown'] == sample['detailed_classification']['slowdown'] and \
+                base_case['detailed_classification']['no steady state'] == sample['detailed_classification']['no steady state']:
+            summary[DIFF][vm][bench][CLASSIFICATIONS] = SAME
+        # If the CIs do overlap, but the classification has moved from bad
+        # inconsistent to good inconsistent, then we say the result was better.
+        if summary[DIFF][vm][bench][CLASSIFICATIONS] == SAME and \
+                base_case['detailed_classification']['no steady state'] > 0 and \
+                sample['detailed_classification']['no steady state'] == 0:
+            summary[DIFF][vm][bench][CLASSIFICATIONS] = BETTER
+        # That completes the category data. The remaining logic deals with the
+        # numerical data (time to reach a steady state, steady state time per
+        # iteration), and produces an overall classification for this benchmark.
+        # Case 1) All flat.
+        if (all_flat(sample['detailed_classification']) and all_flat(base_case['detailed_classification'])):
+            summary[DIFF][vm][bench][STEADY_ITER] = SAME
+            if base_case['steady_state_time_ci'] is None:
+                summary[DIFF][vm][bench][STEADY_STATE_TIME] = DIFFERENT
+            elif do_mean_cis_differ(base_case['steady_state_time'], base_case['steady_state_time_ci'],
+                                    sample['steady_state_time'], sample['steady_state_time_ci']):
+                if sample['steady_state_time'] < base_case['steady_state_time']:
+                    summary[DIFF][vm][bench][STEADY_STATE_TIME] = BETTER
+                else:
+                    summary[DIFF][vm][bench][STEADY_STATE_TIME] = WORSE
+            else:
+                summary[DIFF][vm][bench][STEADY_STATE_TIME] = SAME
+                var = does_ci_narrow(base_case['steady_state_time'], base_case['steady_state_time_ci'],
+                                     sample['steady_state_time'], sample['steady_state_time_ci'])
+                summary[DIFF][vm][bench][STEADY_STATE_TIME_VAR] = var
+        # Case 2) One ALL FLAT, one not.
+        elif (all_flat(sample['detailed_classification']) or all_flat(base_case['detailed_classification'])):
+            if (any_nss(sample['detailed_classification']) or any_nss(base_case['detailed_classification'])):
+                summary[DIFF][vm][bench][STEADY_ITER] = DIFFERENT
+            elif (all_flat(base_case['detailed_classification']) and
+                  do_intervals_differ((1.0, 1.0), sample['steady_state_iteration_iqr'])):
+                if sample['steady_state_iteration'] < base_case['steady_state_iteration']:
+                    summary[DIFF][vm][bench][STEADY_ITER] = BETTER
+                else:
+                    summary[DIFF][vm][bench][STEADY_ITER] = WORSE
+            elif (all_flat(sample['detailed_classification']) and
+                  do_intervals_differ((1.0, 1.0), base_case['steady_state_iteration_iqr'])):
+                if sample['steady_state_iteration'] < base_case['steady_state_iteration']:
+                    summary[DIFF][vm][bench][STEADY_ITER] = BETTER
+                else:
+                    summary[DIFF][vm][bench][STEADY_ITER] = WORSE
+            else:
+                summary[DIFF][vm][bench][STEADY_ITER] = SAME
+            if (any_nss(sample['detailed_classification']) or any_nss(base_case['detailed_classification'])):
+                summary[DIFF][vm][bench][STEADY_STATE_TIME] = DIFFERENT
+            elif do_mean_cis_differ(base_case['steady_state_time'], base_case['steady_state_time_ci'],
+                                    sample['steady_state_time'], sample['steady_state_time_ci']):
+                if sample['steady_state_time'] < base_case['steady_state_time']:
+                    summary[DIFF][vm][bench][STEADY_STATE_TIME] = BETTER
+                else:
+                    summary[DIFF][vm][bench][STEADY_STATE_TIME] = WORSE
+            else:
+                summary[DIFF][vm][bench][STEADY_STATE_TIME] = SAME
+                var = does_ci_narrow(base_case['steady_state_time'], base_case['steady_state_time_ci'],
+                                     sample['steady_state_time'], sample['steady_state_time_ci'])
+                summary[DIFF][vm][bench][STEADY_STATE_TIME_VAR] = var
+        # Case 3) One contains an NSS (therefore no steady iter / perf available).
+        elif (any_nss(sample['detailed_classification']) or any_nss(base_case['detailed_classification'])):
+            pass
+        # Case 4) All three measures should be available in both the DEFAULT_ITER and last_iter cases.
+        else:
+            # If n_pexecs is small, and the steady_iters are all identical,
+            # we sometimes get odd IQRs like [7.000000000000001, 7.0], so
+            # deal with this as a special case to avoid triggering the assertion
+            # in do_intervals_differ.
+            if len(set(sample['steady_state_iteration_list'])) == 1:
+                fake_iqr = (float(sample['steady_state_iteration_list'][0]), float(sample['steady_state_iteration_list'][0]))
+                if do_intervals_differ(base_case['steady_state_iteration_iqr'], fake_iqr):
+                    if sample['steady_state_iteration'] < base_case['steady_state_iteration']:
+                        summary[DIFF][vm][bench][STEADY_ITER] = BETTER
+                    else:
+                        summary[DIFF][vm][bench][STEADY_ITER] = WORSE
+                else:
+                    summary[DIFF][vm][bench][STEADY_ITER] = SAME
+                summary[DIFF][vm][bench][STEADY_ITER_VAR] = SAME
+            elif do_intervals_differ(base_case['steady_state_iteration_iqr'],
+                                     sample['steady_state_iteration_iqr']):
+                if sample['steady_state_iteration'] < base_case['steady_state_iteration']:
+                    summary[DIFF][vm][bench][STEADY_ITER] = BETTER
+                else:
+                    summary[DIFF][vm][bench][STEADY_ITER] = WORSE
+                var = does_interval_narrow(base_case['steady_state_iteration_iqr'], sample['steady_state_iteration_iqr'])
+                summary[DIFF][vm][bench][STEADY_ITER_VAR] = var
+            else:
+                summary[DIFF][vm][bench][STEADY_ITER] = SAME
+                var = does_interval_narrow(base_case['steady_state_iteration_iqr'], sample['steady_state_iteration_iqr'])
+                summary[DIFF][vm][bench][STEADY_ITER_VAR] = var
+            if do_mean_cis_differ(base_case['steady_state_time'], base_case['steady_state_time_ci'],
+                                  sample['steady_state_time'], sample['steady_state_time_ci']):
+                if sample['steady_state_time'] < base_case['steady_state_time']:
+                    summary[DIFF][vm][bench][STEADY_STATE_TIME] = BETTER
+                else:
+                    summary[DIFF][vm][bench][STEADY_STATE_TIME] = WORSE
+            else:
+                summary[DIFF][vm][bench][STEADY_STATE_TIME] = SAME
+            var = does_ci_narrow(base_case['steady_state_time'], base_case['steady_state_time_ci'],
+                                 sample['steady_state_time'], sample['steady_state_time_ci'])
+            summary[DIFF][vm][bench][STEADY_STATE_TIME_VAR] = var
+        # Was the benchmark better or worse overall?
+        if not (BETTER in summary[DIFF][vm][bench] or WORSE in summary[DIFF][vm][bench] or
+                DIFFERENT in summary[DIFF][vm][bench]):
+            summary[DIFF][vm][bench][INTERSECTION] = SAME
+        elif BETTER in summary[DIFF][vm][bench] and not WORSE in summary[DIFF][vm][bench]:
+            summary[DIFF][vm][bench][INTERSECTION] = BETTER
+        elif WORSE in summary[DIFF][vm][bench] and not BETTER in summary[DIFF][vm][bench]:
+            summary[DIFF][vm][bench][INTERSECTION] = WORSE
+        else:
+            summary[DIFF][vm][bench][INTERSECTION] = DIFFERENT
+    with open(summary_filename, 'w') as fd:
+        json.dump(summary, fd, ensure_ascii=True, indent=4)
+        print('Saved: %s' % summary_filename)
+    return summary
+
+
+def colour_tex_cell(result, text):
+    """Colour a table cell containing `text` according to `result`."""
+
+    assert result in (None, SAME, DIFFERENT, BETTER, WORSE)
+    if not text or result is None or result == SAME:
+        return text
+    if result == BETTER:
+        colour = 'lightgreen'
+    elif result == WORSE:
+        colour = 'lightred'
+    else:
+        colour = 'lightyellow'
+    return '\\cellcolor{%s!25}{%s}' % (colour, text)
+
+
+def write_latex_table(machine, all_benchs, summary, diff, skipped, tex_file, num_splits,
+                      with_preamble=False, longtable=False, diff_vms=[]):
+    """Write a tex table to disk"""
+
+    num_benchmarks = len(all_benchs)
+    all_vms = sorted(summary.keys())
+    num_vms = len(summary)
+
+    # decide how to lay out the splits
+    num_vms_rounded = int(math.ceil(num_vms / float(num_splits)) * num_splits)
+    vms_per_split = int(num_vms_rounded / float(num_splits))
+    splits = [[] for x in xrange(num_splits)]
+    vm_num = 0
+    split_idx = 0
+    for vm_idx in xrange(num_vms_rounded):
+        if vm_idx < len(all_vms):
+            vm = all_vms[vm_idx]
+        else:
+            vm = None
+        splits[split_idx].append(vm)
+        vm_num += 1
+        if vm_num % vms_per_split == 0:
+            split_idx += 1
+
+    with open(tex_file, 'w') as fp:
+        if with_preamble:
+            fp.write(preamble(TITLE))
+            if diff_vms:
+                fp.write('\\centering{%%\n\\Large{\\textbf{%s vs. %s}}%%\n}\n\\\\\n~\\\\\n\n'
+                         % (diff_vms[0], diff_vms[1]))
+            legends = get_latex_symbol_map() + ' \\\\ ' + legend()
+            fp.write('\\centering %s' % legends)
+            fp.write('\n\n\n')
+            if not longtable:
+                fp.write('\\begin{landscape}\n')
+                fp.write('\\begin{table*}[hptb]\n')
+                fp.write('\\vspace{.8cm}\n')
+                fp.write('\\begin{adjustbox}{totalheight=12.4cm}\n')
+        # Emit table header.
+        heads1 = TABLE_HEADINGS_START1 + '&'.join([TABLE_HEADINGS1] * num_splits)
+        heads2 = TABLE_HEADINGS_START2 + '&'.join([TABLE_HEADINGS2] * num_splits)
+        heads = '%s\\\\%s' % (heads1, heads2)
+        if longtable:
+            fp.write(start_longtable(TABLE_FORMAT, heads))
+        else:
+            fp.write(start_table(TABLE_FORMAT, heads))
+        split_row_idx = 0
+        for row_vms in zip(*splits):
+            bench_idx = 0
+            skipped_before = [b for (b, v) in skipped[SKIPPED_BEFORE] if v == row_vms[0]]
+            skipped_after = [b for (b, v) in skipped[SKIPPED_AFTER] if v == row_vms[0]]
+            for bench in sorted(all_benchs + skipped_before + skipped_after):
+                row = []
+                for vm in row_vms:
+                    if vm is None:
+                        continue # no more results
+                    try:
+                        this_summary = summary[vm][bench]
+                    except KeyError:
+                        if bench in skipped_before or bench in skipped_after:
+                            classification = '\\emph{Skipped}'
+                        else:
+                            classification = ''
+                        last_cpt = BLANK_CELL
+                        time_steady = BLANK_CELL
+                        last_mean = BLANK_CELL
+                        steady_iter_var = BLANK_CELL
+                        steady_time_var = BLANK_CELL
+                    else:
+                        if vm in diff and bench in diff[vm]:
+                            classification = colour_tex_cell(diff[vm][bench][CLASSIFICATIONS], this_summary['style'])
+                            last_cpt = colour_tex_cell(diff[vm][bench][STEADY_ITER], this_summary['last_cpt'])
+                            steady_iter_var = colour_tex_cell(diff[vm][bench][STEADY_ITER_VAR], this_summary['steady_iter_var'])
+                            time_steady = colour_tex_cell(diff[vm][bench][STEADY_ITER], this_summary['time_to_steady_state'])
+                            last_mean = colour_tex_cell(diff[vm][bench][STEADY_STATE_TIME], this_summary['last_mean'])
+                            steady_time_var = colour_tex_cell(diff[vm][bench][STEADY_STATE_TIME_VAR], this_summary['steady_time_var'])
+                        else:
+                            classification = this_summary['style']
+                            last_cpt = this_summary['last_cpt']
+                            steady_iter_var = this_summary['steady_iter_var']
+                            time_steady = this_summary['time_to_steady_state']
+                            last_mean = this_summary['last_mean']
+                            steady_time_var = this_summary['steady_time_var']
+                        classification = '\\multicolumn{1}{l}{%s}' % classification
+                        if classification == STYLE_SYMBOLS['flat']:
+                            last_cpt = BLANK_CELL
+                            time_steady = BLANK_CELL
+                    if last_cpt == '':
+                        last_cpt = BLANK_CELL
+                    if time_steady == '':
+                        time_steady = BLANK_CELL
+                    if last_mean == '':
+                        last_mean = BLANK_CELL
+
+                    if bench_idx == 0:
+                        if num_benchmarks == 10:
+                            fudge = 4
+                        elif num_benchmarks == 12:
+                            fudge = 5
+                        else:
+                            fudge = 0
+                        vm_cell = '\\multirow{%s}{*}{\\rotatebox[origin=c]{90}{%s}}' \
+                            % (num_benchmarks + fudge, vm)
+                    else:
+                        vm_cell = ''
+                    row_add = [BLANK_CELL, vm_cell, classification, last_cpt,
+                               steady_iter_var, time_steady, last_mean, steady_time_var]
+                    if not row:  # First bench in this row, needs the vm column.
+                        if vm in diff and bench in diff[vm]:
+                            bname = colour_tex_cell(diff[vm][bench][INTERSECTION], bench)
+                        else:
+                            bname = bench
+                        row.insert(0, escape(bname))
+                    row.extend(row_add)
+                    vm_idx += 1
+                fp.write('&'.join(row))
+                # Only -ve space row if not next to a midrule
+                if not longtable and bench_idx < num_vms - 1:
+                    fp.write('\\\\[-3pt] \n')
+                else:
+                    fp.write('\\\\ \n')
+                bench_idx += 1
+            if split_row_idx < vms_per_split - 1:
+                if longtable:
+                    fp.write('\\hline\n')
+                else:
+                    fp.write('\\midrule\n')
+            split_row_idx += 1
+        if longtable:
+            fp.write(end_longtable())
+        else:
+            fp.write(end_table())
+        if with_preamble:
+            if not longtable:
+                fp.write('\\end{adjustbox}\n')
+                fp.write('\\end{table*}\n')
+                fp.write('\\end{landscape}\n')
+            fp.write(end_document())
+
+
+def write_diff_tables(diff_summary, html_file=None, tex_file=None, num_splits=1,
+                      with_preamble=True, diff_vms=[]):
+    """Write a diff summary (as returned by diff()) to an HTML and / or a LaTeX
+    file."""
+
+    classifier = diff_summary[CLASSIFIER]
+    if html_file:
+        print('Writing data to: %s' % html_file)
+        write_html_table(diff_summary[AFTER], html_file, diff=diff_summary[DIFF],
+                         skipped=diff_summary[SKIPPED], previous=diff_summary[BEFORE])
+    if tex_file:
+        machine, bmarks, latex_summary = convert_to_latex(diff_summary[AFTER], classifier['delta'],
+                                                          classifier['steady'], diff=diff_summary[DIFF],
+                                                          previous=diff_summary[BEFORE])
+        print('Writing data to: %s' % tex_file)
+        write_latex_table(machine, bmarks, latex_summary, diff_summary[DIFF],
+                          diff_summary[SKIPPED], tex_file, num_splits,
+                          with_preamble=with_preamble, longtable=True, diff_vms=diff_vms)
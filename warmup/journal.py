@@ -0,0 +1,129 @@
+"""A journal of the per-benchmark results of a pipeline stage, so that a long
+run which is killed can be resumed.
+
+Stages which annotate Krun results files only write their output file once
+every benchmark has been processed. While a stage runs, the results of each
+benchmark are also appended, as soon as they are computed, to a sidecar
+journal next to the output file (see journal_filename()). Once the output
+file has been written (which write_krun_results_file() does atomically), the
+journal is removed. If the run is killed, a later run of the same stage, with
+the same parameters and resume=True, reuses every benchmark in the journal
+whose input data is unchanged.
+
+Unlike a StageCache, a journal belongs to one output file, and only lives
+until that file is written.
+"""
+
+import array
+import hashlib
+import json
+import os
+import os.path
+import struct
+
+# Change this whenever the format of journals changes.
+_JOURNAL_FORMAT = 1
+
+JOURNAL_SUFFIX = '.journal'
+
+
+def journal_filename(output_file):
+    """Name of the journal kept while output_file is being computed."""
+    return output_file + JOURNAL_SUFFIX
+
+
+def remove_journal(filename):
+    """Remove a journal (if it exists), once its output file has been written."""
+    try:
+        os.remove(filename)
+    except OSError:
+        pass
+
+
+def _update_digest(sha1, data):
+    # Numbers are hashed as doubles, which is much faster than hashing their
+    # JSON encoding. Lengths are included, so that nesting is unambiguous.
+    sha1.update(struct.pack('<Q', len(data)))
+    if len(data) and hasattr(data[0], '__len__'):
+        for item in data:
+            _update_digest(sha1, item)
+    elif hasattr(data, 'dtype'):  # A NumPy array, e.g. read from a results cache.
+        sha1.update(data.astype('d').tostring())
+    else:
+        sha1.update(array.array('d', data).tostring())
+
+
+class Journal(object):
+    """Journal, stored in filename, of the per-benchmark results of one stage,
+    run with one set of parameters. parameters must be JSON serialisable, and
+    should include everything (other than the input data) which may change
+    the results. If resume is True, entries are loaded from an existing
+    journal with the same stage and parameters; otherwise, any existing
+    journal is discarded.
+    """
+
+    def __init__(self, filename, stage, parameters, resume=False):
+        self.filename = filename
+        self.resumed = 0
+        self._header = json.dumps([_JOURNAL_FORMAT, stage, parameters], sort_keys=True)
+        self._entries = dict()  # Benchmark -> (digest, results).
+        if resume:
+            self._load()
+        # Rewrite the journal, dropping entries which were not loaded (and
+        # any partial entry written as the last run was killed).
+        tmp_file = self.filename + '.tmp'
+        with open(tmp_file, 'w') as file_:
+            file_.write(self._header + '\n')
+            for bench in sorted(self._entries):
+                file_.write(self._encode(bench, *self._entries[bench]))
+        os.rename(tmp_file, self.filename)
+        self._file = open(self.filename, 'a')
+
+    def _load(self):
+        try:
+            with open(self.filename, 'r') as file_:
+                if file_.readline().rstrip('\n') != self._header:
+                    print('Journal %s was written with different parameters; ignoring it.' %
+                          self.filename)
+                    return
+                for line in file_:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:  # Partially written.
+                        break
+                    self._entries[entry['key']] = (entry['digest'], entry['results'])
+        except IOError:  # No journal.
+            pass
+
+    def _encode(self, bench, digest, results):
+        return json.dumps({'key': bench, 'digest': digest, 'results': results}) + '\n'
+
+    def digest(self, data):
+        """Return a hash of the input data for one benchmark: a list (or NumPy
+        array) of numbers, or a (nested) list of such lists.
+        """
+        sha1 = hashlib.sha1()
+        _update_digest(sha1, data)
+        return sha1.hexdigest()
+
+    def get(self, bench, digest):
+        """Return the results journalled for bench, if its input data had the
+        same digest, or None.
+        """
+        entry = self._entries.get(bench)
+        if entry is None or entry[0] != digest:
+            return None
+        self.resumed += 1
+        return entry[1]
+
+    def put(self, bench, digest, results):
+        """Append the results of bench to the journal. Each entry is flushed
+        to disk before this returns.
+        """
+        self._entries[bench] = (digest, results)
+        self._file.write(self._encode(bench, digest, results))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
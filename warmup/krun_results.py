@@ -1,7 +1,20 @@
 import bz2
 import csv
+import hashlib
 import json
+import os
 import os.path
+import re
+import struct
+
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+from warmup import profiling
+
+try:
+    import numpy
+except ImportError:  # The results cache is not available without numpy.
+    numpy = None
 
 
 _MACHINES = {
@@ -32,6 +45,44 @@ _SKIP_OUTER_KEYS = ['audit', 'reboots', 'mperf_counts', 'aperf_counts',
                     'config', 'error_flag', 'window_size']
 
 
+# Top-level fields of a Krun results file which are NOT dictionaries keyed by
+# benchmark key (bench:vm:variant).
+_NON_BENCHMARK_FIELDS = ['audit', 'classifier', 'config', 'eta_estimates',
+                         'error_flag', 'reboots', 'starting_temperatures',
+                         'window_size']
+
+# Annotation stages which may have been run on a Krun results file, and a
+# top-level field which is present once each stage has been run.
+_STAGE_FIELDS = [('outliers', 'all_outliers'), ('changepoints', 'classifications')]
+
+# Amount of decompressed data read from a results file at a time, when
+# streaming. Only whole JSON values are ever decoded.
+_STREAM_CHUNK_SIZE = 1024 * 1024
+
+# Sidecar cache files, written next to Krun results files by
+# write_krun_results_cache(). The measurement fields below are stored as
+# flat, memory-mappable arrays. The rest of the document is stored as JSON.
+CACHE_SUFFIX = '.cache'
+_CACHE_MAGIC = 'WARMUPCACHE2'
+_CACHE_FIELDS = ['wallclock_times', 'core_cycle_counts', 'aperf_counts',
+                 'mperf_counts']
+_CACHE_ALIGNMENT = 8
+
+# With jobs > 1, write_krun_results_file() compresses results as a series of
+# independent bz2 streams of (up to) this much JSON text, which bunzip2 and
+# read_krun_results_file() decompress as if they were one.
+_BZ2_STREAM_SIZE = 4 * 1024 * 1024
+_BZ2_READ_SIZE = 1024 * 1024
+# Each bz2 stream starts with a header ('BZh' and a block size) followed by
+# the (byte-aligned) magic number of its first block.
+_BZ2_STREAM_START = re.compile(r'BZh[1-9]\x31\x41\x59\x26\x53\x59')
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_STRUCTURAL = re.compile(r'["\[\]{}]')
+_STRING_BODY = re.compile(r'(?:[^"\\]|\\.)*', re.DOTALL)
+_SCALAR_END = re.compile(r'[,\]}: \t\n\r]')
+
+
 def csv_to_krun_json(in_files, language, vm, uname):
     for filename in in_files:
         data_dictionary = _BLANK_BENCHMARK
@@ -114,13 +165,24 @@ def copy_results(key, p_execs, from_results, to_results):
         to_results['common_outliers'][key].append(from_results['common_outliers'][key][p_exec])
 
 
-def parse_krun_file_with_changepoints(json_files):
+def parse_krun_file_with_changepoints(json_files, use_cache=False):
+    def read_files():
+        for filename in json_files:
+            assert os.path.exists(filename), 'File %s does not exist.' % filename
+            yield read_krun_results_file(filename, use_cache=use_cache)
+    return merge_krun_results_with_changepoints(read_files())
+
+
+def merge_krun_results_with_changepoints(all_results):
+    """Merge Krun results (already annotated with changepoints) by machine.
+    Returns the classifier options used, and a dictionary of machine name to
+    merged results. Note that the first results seen for each machine are
+    updated in place.
+    """
     data_dictionary = dict()
     classifier = None  # steady and delta values used by classifer.
     window_size = None
-    for filename in json_files:
-        assert os.path.exists(filename), 'File %s does not exist.' % filename
-        data = read_krun_results_file(filename)
+    for data in all_results:
         assert 'classifications' in data, 'Please run mark_changepoints_in_json before re-running this script.'
         machine_name = data['audit']['uname'].split(' ')[1]
         if '.' in machine_name:  # Remove domain, if there is one.
@@ -155,18 +217,691 @@ def parse_krun_file_with_changepoints(json_files):
     return classifier, data_dictionary
 
 
-def read_krun_results_file(results_file):
+def read_krun_results_file(results_file, use_cache=False, jobs=1, arrays=False):
     """Return the JSON data stored in a Krun results file.
+
+    If use_cache is True, the data is loaded from the sidecar cache of the
+    results file if that is up to date, and otherwise the cache is (re)built
+    after the results file has been read. Data read from the cache is
+    identical to data read from the results file, unless arrays is also True:
+    run sequences are then returned as NumPy arrays memory-mapped from the
+    cache (see read_krun_results_cache()), rather than copied into lists.
+    encode_krun_results() writes such arrays as the lists they replaced. If
+    jobs > 1, and the file consists of several bz2 streams, the streams are
+    decompressed in parallel.
+    """
+    if use_cache and numpy is not None:
+        with profiling.stage('cache read'):
+            results = read_krun_results_cache(results_file, as_lists=not arrays)
+        if results is not None:
+            return results
+    with profiling.stage('bz2 decode'):
+        text = _read_bz2_file(results_file, jobs)
+    if not (use_cache and numpy is not None):
+        with profiling.stage('json parse'):
+            return json.loads(text)
+    with profiling.stage('json parse'):
+        # The cache records the order of the keys in the file, so that it can
+        # rebuild identical dictionaries.
+        ordered = json.loads(text, object_pairs_hook=OrderedDict)
+        del text
+        results = _plain_dicts(ordered)
+    try:
+        with profiling.stage('cache write'):
+            write_krun_results_cache(ordered, results_file)
+    except (IOError, OSError):  # e.g. a read-only results directory.
+        pass
+    return results
+
+
+def _plain_dicts(value):
+    """Return JSON data decoded with object_pairs_hook=OrderedDict, with each
+    OrderedDict replaced by a dictionary, exactly as json.loads() would have
+    decoded it without the hook. Lists which hold no dictionaries or lists
+    (e.g. run sequences) are shared with value, rather than copied.
+    """
+    if isinstance(value, OrderedDict):
+        # Keys are inserted in the order of the file, as json.loads() does.
+        return dict((key, _plain_dicts(item)) for key, item in value.iteritems())
+    if isinstance(value, list) and not set(map(type, value)).isdisjoint((OrderedDict, list)):
+        return [_plain_dicts(item) for item in value]
+    return value
+
+
+def _file_sha1(filename):
+    sha1 = hashlib.sha1()
+    with open(filename, 'rb') as file_:
+        for block in iter(lambda: file_.read(1024 * 1024), ''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def _flatten_cache_field(field_data):
+    """Flatten one measurement field (key -> pexecs -> run sequence, or
+    key -> pexecs -> cores -> run sequence) into a list of values and an
+    index of [key, entries] pairs, in the order of the keys in field_data,
+    where each entry is a [start, stop] pair of offsets into the list of
+    values (or a list of such pairs, for per-core data). Returns None if the
+    field cannot be stored exactly as a single float64 or int64 array.
+    """
+    values = list()
+    index = list()
+
+    def add_sequence(sequence):
+        if not isinstance(sequence, list):
+            raise TypeError
+        start = len(values)
+        values.extend(sequence)
+        return [start, len(values)]
+
+    try:
+        for key in field_data:
+            entries = list()
+            for p_exec in field_data[key]:
+                if p_exec is None:
+                    entries.append(None)
+                elif p_exec and isinstance(p_exec[0], list):  # Per-core data.
+                    entries.append([add_sequence(core) for core in p_exec])
+                else:
+                    entries.append(add_sequence(p_exec))
+            index.append([key, entries])
+    except TypeError:
+        return None
+    types = set(type(value) for value in values)
+    if types <= set([int, long]):
+        if values and (min(values) < -2 ** 63 or max(values) >= 2 ** 63):
+            return None
+        dtype = 'int64'
+    elif types <= set([int, long, float]):
+        # Integers are converted back from float64 when the cache is read
+        # (see read_krun_results_cache()), so they must be exactly
+        # representable.
+        if any(abs(value) > 2 ** 53 for value in values if type(value) is not float):
+            return None
+        dtype = 'float64'
+    else:  # e.g. None values in a run sequence.
+        return None
+    return dtype, values, index
+
+
+def write_krun_results_cache(results, results_file):
+    """Write the sidecar cache for a Krun results file. The cache records the
+    size, modification time and SHA1 hash of the results file, so that it is
+    ignored by read_krun_results_cache() if the results file changes.
+
+    The cache consists of a magic string, the length of a JSON header, the
+    JSON header itself and then (8-byte aligned) arrays of measurement data.
+    The header contains the rest of the Krun results document, and for each
+    measurement field, the offset of its array and [start, stop] indices into
+    the array for each key and process execution. A measurement field which
+    mixes integers and floats also has a mask array, recording which values
+    were integers.
+
+    In Python 2, the order in which a dictionary's keys are iterated over
+    depends on the order in which they were inserted, so the order of keys
+    in results is recorded too. For read_krun_results_cache() to return
+    exactly what json.loads() returns, results should be decoded with
+    object_pairs_hook=OrderedDict.
+    """
+    stat = os.stat(results_file)
+    header = {'source': {'size': stat.st_size, 'mtime': stat.st_mtime,
+                         'sha1': _file_sha1(results_file)},
+              'order': list(results), 'document': OrderedDict(), 'fields': dict()}
+    arrays = list()
+    offset = 0  # Array offsets are relative to the (aligned) end of the header.
+    for field in results:
+        flattened = None
+        if field in _CACHE_FIELDS:
+            flattened = _flatten_cache_field(results[field])
+        if flattened is None:
+            header['document'][field] = results[field]
+            continue
+        dtype, values, index = flattened
+        arrays.append(numpy.array(values, dtype=dtype))
+        header['fields'][field] = {'dtype': dtype, 'length': len(values),
+                                   'offset': offset, 'index': index}
+        offset += arrays[-1].nbytes
+        if dtype == 'float64':
+            ints = numpy.array([type(value) is not float for value in values],
+                               dtype=numpy.uint8)
+            if ints.any():
+                # Padded, so that the next array is aligned.
+                padding = numpy.zeros(-ints.nbytes % _CACHE_ALIGNMENT, dtype=numpy.uint8)
+                arrays.extend([ints, padding])
+                header['fields'][field]['ints_offset'] = offset
+                offset += ints.nbytes + padding.nbytes
+    header_json = json.dumps(header)
+    data_start = len(_CACHE_MAGIC) + 8 + len(header_json)
+    padding = -data_start % _CACHE_ALIGNMENT
+    cache_file = results_file + CACHE_SUFFIX
+    tmp_file = cache_file + '.tmp'
+    with open(tmp_file, 'wb') as file_:
+        file_.write(_CACHE_MAGIC)
+        file_.write(struct.pack('<Q', len(header_json)))
+        file_.write(header_json)
+        file_.write('\0' * padding)
+        for array in arrays:
+            array.tofile(file_)
+    os.rename(tmp_file, cache_file)
+    return cache_file
+
+
+def _read_krun_results_cache_header(results_file):
+    """Return the header of the sidecar cache of a Krun results file, and the
+    offset of the first array in the cache, or None if there is no cache, or
+    it is out of date.
+    """
+    cache_file = results_file + CACHE_SUFFIX
+    if not os.path.exists(cache_file):
+        return None
+    with open(cache_file, 'rb') as file_:
+        if file_.read(len(_CACHE_MAGIC)) != _CACHE_MAGIC:
+            return None
+        header_length = struct.unpack('<Q', file_.read(8))[0]
+        header = json.loads(file_.read(header_length))
+    stat = os.stat(results_file)
+    source = header['source']
+    if source['size'] != stat.st_size:
+        return None
+    if source['mtime'] != stat.st_mtime and source['sha1'] != _file_sha1(results_file):
+        return None
+    data_start = len(_CACHE_MAGIC) + 8 + header_length
+    data_start += -data_start % _CACHE_ALIGNMENT
+    return header, data_start
+
+
+def read_krun_results_cache(results_file, as_lists=False):
+    """Return the data stored in the sidecar cache of a Krun results file, or
+    None if there is no cache, or it is out of date. Unless as_lists is True,
+    run sequences are returned as (read-only) NumPy arrays, memory-mapped
+    from the cache, in place of lists of numbers. A run sequence which mixes
+    integers and floats cannot be represented exactly by an array, so is
+    always returned as a list.
+    """
+    cache_file = results_file + CACHE_SUFFIX
+    if numpy is None:
+        return None
+    cache_header = _read_krun_results_cache_header(results_file)
+    if cache_header is None:
+        return None
+    header, data_start = cache_header
+
+    def memmap(dtype, offset, length):
+        if length == 0:
+            return numpy.zeros(0, dtype=dtype)
+        return numpy.memmap(cache_file, dtype=dtype, mode='r', offset=data_start + offset,
+                            shape=(length,))
+
+    results = dict()
+    for field in header['order']:
+        if field in header['document']:
+            results[field] = header['document'][field]
+            continue
+        info = header['fields'][field]
+        array = memmap(info['dtype'], info['offset'], info['length'])
+        ints = None
+        if 'ints_offset' in info:
+            ints = memmap(numpy.uint8, info['ints_offset'], info['length'])
+
+        def sequence(start, stop):
+            if ints is not None and ints[start:stop].any():
+                values = array[start:stop].tolist()
+                for index in numpy.flatnonzero(ints[start:stop]):
+                    values[index] = int(values[index])
+                return values
+            elif as_lists:
+                return array[start:stop].tolist()
+            return array[start:stop]
+
+        results[field] = dict()
+        for key, entries in info['index']:
+            results[field][key] = list()
+            for entry in entries:
+                if entry is None:
+                    results[field][key].append(None)
+                elif entry and isinstance(entry[0], list):  # Per-core data.
+                    results[field][key].append([sequence(start, stop) for start, stop in entry])
+                else:
+                    results[field][key].append(sequence(entry[0], entry[1]))
+    return results
+
+
+class _MultiStreamBZ2File(object):
+    """A read-only file object for bz2 files which may contain several
+    concatenated bz2 streams, as written by write_krun_results_file() (with
+    jobs > 1) or by tools such as pbzip2. In Python 2, bz2.BZ2File silently
+    stops reading at the end of the first stream.
+    """
+
+    def __init__(self, filename):
+        self._file = open(filename, 'rb')
+        self._decompressor = bz2.BZ2Decompressor()
+        self._unused = ''  # Compressed data from the start of the next stream.
+        self._buffer = ''
+        self._eof = False
+
+    def _decompress_more(self):
+        data = self._unused or self._file.read(_BZ2_READ_SIZE)
+        self._unused = ''
+        if not data:
+            try:
+                self._decompressor.decompress('')
+            except EOFError:  # The last stream was complete.
+                self._eof = True
+                return
+            raise EOFError('Compressed file ended before the end-of-stream marker was reached')
+        try:
+            self._buffer += self._decompressor.decompress(data)
+        except EOFError:  # The previous stream ended exactly where data starts.
+            self._decompressor = bz2.BZ2Decompressor()
+            self._buffer += self._decompressor.decompress(data)
+        if self._decompressor.unused_data:
+            self._unused = self._decompressor.unused_data
+            self._decompressor = bz2.BZ2Decompressor()
+
+    def read(self, size=-1):
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            self._decompress_more()
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _decompress_bz2_stream(data):
+    """Decompress one complete bz2 stream, or return None if data is not
+    exactly one complete stream.
     """
-    results = None
-    with bz2.BZ2File(results_file, 'rb') as file_:
-        results = json.loads(file_.read())
-        return results
+    decompressor = bz2.BZ2Decompressor()
+    try:
+        text = decompressor.decompress(data)
+    except IOError:  # Invalid data.
+        return None
+    if decompressor.unused_data:
+        return None
+    try:
+        decompressor.decompress('')
+    except EOFError:  # The end-of-stream marker was found.
+        return text
     return None
 
 
-def write_krun_results_file(results, filename):
-    """Write a Krun results file to disk."""
+def _read_bz2_file(filename, jobs=1):
+    """Return the decompressed contents of a (possibly multi-stream) bz2 file.
+    If jobs > 1, the file is split into streams, which are decompressed in
+    parallel. Stream headers are found by searching for their magic numbers,
+    which may (very rarely) also appear inside compressed data. If that
+    happens, some of the pieces will not decompress to exactly one complete
+    stream, and the whole file is decompressed sequentially instead.
+    """
+    if jobs > 1:
+        with open(filename, 'rb') as file_:
+            data = file_.read()
+        starts = [match.start() for match in _BZ2_STREAM_START.finditer(data)]
+        if len(starts) > 1 and starts[0] == 0:
+            pieces = [data[start:end] for start, end in zip(starts, starts[1:] + [len(data)])]
+            pool = ThreadPool(min(jobs, len(pieces)))
+            try:
+                texts = pool.map(_decompress_bz2_stream, pieces)
+            finally:
+                pool.close()
+                pool.join()
+            if None not in texts:
+                return ''.join(texts)
+    with _MultiStreamBZ2File(filename) as file_:
+        return file_.read()
+
+
+class _JSONStream(object):
+    """A minimal pull parser over a (large) JSON document, read from a file
+    object in chunks. The caller walks the structure of the document with
+    open_container() and items(), and decodes or skips one value at a time,
+    so only the values which are actually needed are held in memory.
+    """
+
+    def __init__(self, file_, chunk_size=_STREAM_CHUNK_SIZE):
+        self._file = file_
+        self._chunk_size = chunk_size
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self):
+        """Read another chunk of the file, discarding text which has already
+        been consumed. Return False at the end of the file.
+        """
+        if self._eof:
+            return False
+        chunk = self._file.read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def _error(self, msg):
+        return ValueError('%s (near: %r)' % (msg, self._buf[self._pos:self._pos + 20]))
+
+    def peek(self):
+        """Return the next non-whitespace character, without consuming it,
+        or the empty string at the end of the document.
+        """
+        while True:
+            self._pos = _WHITESPACE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ''
+
+    def open_container(self, opener):
+        """Consume the opening bracket ('{' or '[') of an object or array."""
+        if self.peek() != opener:
+            raise self._error('Expected %r' % opener)
+        self._pos += 1
 
-    with bz2.BZ2File(filename, 'wb') as file_:
-        file_.write(json.dumps(results, indent=4))
+    def items(self, closer):
+        """Yield once per item of the object or array which has just been
+        opened, consuming separators and the closing bracket. The caller must
+        consume exactly one item (key and value, in an object) per iteration.
+        """
+        if self.peek() == closer:
+            self._pos += 1
+            return
+        while True:
+            yield
+            char = self.peek()
+            self._pos += 1
+            if char == closer:
+                return
+            elif char != ',':
+                self._pos -= 1
+                raise self._error('Expected %r or %r' % (',', closer))
+
+    def read_key(self):
+        """Decode the key of an object member and consume the colon."""
+        if self.peek() != '"':
+            raise self._error('Expected an object key')
+        key = self.read_value()
+        if self.peek() != ':':
+            raise self._error('Expected %r' % ':')
+        self._pos += 1
+        return key
+
+    def read_value(self):
+        """Decode and return the next JSON value."""
+        end = self._value_end(discard=False)
+        value = json.loads(self._buf[self._pos:end])
+        self._pos = end
+        return value
+
+    def skip_value(self):
+        """Consume the next JSON value without decoding (or keeping) it."""
+        self._pos = self._value_end(discard=True)
+
+    def count_items(self):
+        """Consume the next JSON value, which must be an array of numbers, and
+        return its length. The array is scanned, but not decoded.
+        """
+        if self.peek() != '[':
+            raise self._error('Expected %r' % '[')
+        end = self._value_end(discard=False)
+        text = self._buf[self._pos + 1:end - 1]
+        self._pos = end
+        if not text.strip():
+            return 0
+        return text.count(',') + 1
+
+    def _value_end(self, discard):
+        """Return the index in the buffer just after the JSON value which
+        starts at the current position, reading more of the file as needed.
+        If discard is True, the text of the value is thrown away as it is
+        scanned, and the returned index is the only useful result.
+        """
+        first = self.peek()
+        if first == '':
+            raise self._error('Unexpected end of document')
+        if first not in '{["':  # Numbers, true, false and null.
+            while True:
+                match = _SCALAR_END.search(self._buf, self._pos)
+                if match is not None:
+                    return match.start()
+                if not self._fill():
+                    return len(self._buf)
+        depth = 0
+        in_string = False
+        offset = 0  # Relative to self._pos, which may move when filling.
+        while True:
+            index = self._pos + offset
+            if in_string:
+                index = _STRING_BODY.match(self._buf, index).end()
+                if index < len(self._buf) and self._buf[index] == '"':
+                    in_string = False
+                    index += 1
+                    if depth == 0:
+                        return index
+                    offset = index - self._pos
+                    continue
+            else:
+                match = _STRUCTURAL.search(self._buf, index)
+                if match is not None:
+                    char = match.group()
+                    index = match.end()
+                    offset = index - self._pos
+                    if char == '"':
+                        in_string = True
+                    elif char in '[{':
+                        depth += 1
+                    else:
+                        depth -= 1
+                        if depth == 0:
+                            return index
+                    continue
+                index = len(self._buf)
+            # We have scanned to the end of the buffer (or to an incomplete
+            # escape sequence in a string), and need more of the document.
+            if discard:
+                self._pos = index
+            offset = index - self._pos
+            if not self._fill():
+                raise self._error('Unexpected end of document')
+
+
+def iter_krun_results(results_file, field='wallclock_times', keys=None):
+    """Lazily iterate over the run sequences stored in one (per-benchmark)
+    field of a Krun results file, without reading the whole file into memory.
+    Yields (key, pexec_index, run_sequence) tuples, in file order. If keys is
+    not None, only benchmark keys in keys are decoded.
+    """
+    with _MultiStreamBZ2File(results_file) as file_:
+        stream = _JSONStream(file_)
+        stream.open_container('{')
+        for _ in stream.items('}'):
+            if stream.read_key() != field:
+                stream.skip_value()
+                continue
+            stream.open_container('{')
+            for _ in stream.items('}'):
+                key = stream.read_key()
+                if keys is not None and key not in keys:
+                    stream.skip_value()
+                    continue
+                stream.open_container('[')
+                pexec_index = 0
+                for _ in stream.items(']'):
+                    yield key, pexec_index, stream.read_value()
+                    pexec_index += 1
+            return  # The rest of the file is not needed.
+
+
+def read_krun_results_fields(results_file, fields=None, keys=None):
+    """Return a subset of the JSON data stored in a Krun results file, reading
+    the file incrementally. If fields is not None, only those top-level fields
+    are decoded, and reading stops as soon as they have all been found. If
+    keys is not None, fields which are keyed by benchmark only contain data
+    for benchmark keys in keys.
+    """
+    results = dict()
+    with _MultiStreamBZ2File(results_file) as file_:
+        stream = _JSONStream(file_)
+        stream.open_container('{')
+        for _ in stream.items('}'):
+            field = stream.read_key()
+            if fields is not None and field not in fields:
+                stream.skip_value()
+                continue
+            if (keys is None or field in _NON_BENCHMARK_FIELDS or
+                    stream.peek() != '{'):
+                results[field] = stream.read_value()
+            else:
+                results[field] = dict()
+                stream.open_container('{')
+                for _ in stream.items('}'):
+                    key = stream.read_key()
+                    if key in keys:
+                        results[field][key] = stream.read_value()
+                    else:
+                        stream.skip_value()
+            if fields is not None and len(results) == len(fields):
+                break
+    return results
+
+
+def probe_krun_results_file(results_file, use_cache=False, complete=True):
+    """Return metadata about a Krun results file, without decoding any of its
+    measurements. The result is a dictionary with the following keys:
+
+      keys: sorted list of benchmark keys (bench:vm:variant).
+      pexecs: benchmark key -> number of process executions.
+      iterations: benchmark key -> list of the number of iterations in each
+          process execution (0 if the process execution crashed).
+      machine: the machine name from the audit, or None.
+      stages: annotation stages which have been run on the file (a subset of
+          ['outliers', 'changepoints']).
+      window_size: the window size used to mark outliers, or None.
+
+    If use_cache is True and the sidecar cache of the results file is up to
+    date, only the header of the cache is read. Otherwise the file is
+    streamed, and everything other than the audit and window size is
+    scanned without being decoded. If complete is False, streaming stops
+    after the first process execution which did not crash: keys, pexecs and
+    iterations then only describe the benchmarks scanned so far, and the
+    other metadata only the fields which precede them in the file.
+    """
+    fields, lengths, values = set(), dict(), dict()
+    cache_header = None
+    if use_cache:
+        cache_header = _read_krun_results_cache_header(results_file)
+    if cache_header is not None:
+        header = cache_header[0]
+        fields.update(header['document'])
+        fields.update(header['fields'])
+        for field in ('audit', 'window_size'):
+            if field in header['document']:
+                values[field] = header['document'][field]
+        if 'wallclock_times' in header['fields']:
+            for key, entries in header['fields']['wallclock_times']['index']:
+                lengths[key] = [0 if entry is None else entry[1] - entry[0]
+                                for entry in entries]
+        elif 'wallclock_times' in header['document']:
+            wallclock_times = header['document']['wallclock_times']
+            for key in wallclock_times:
+                lengths[key] = [len(p_exec or []) for p_exec in wallclock_times[key]]
+    else:
+        with _MultiStreamBZ2File(results_file) as file_:
+            stream = _JSONStream(file_)
+            stream.open_container('{')
+            found_full_pexec = False
+            for _ in stream.items('}'):
+                field = stream.read_key()
+                fields.add(field)
+                if field == 'wallclock_times':
+                    stream.open_container('{')
+                    for _ in stream.items('}'):
+                        key = stream.read_key()
+                        lengths[key] = list()
+                        stream.open_container('[')
+                        for _ in stream.items(']'):
+                            lengths[key].append(stream.count_items())
+                            found_full_pexec = found_full_pexec or lengths[key][-1] > 0
+                            if found_full_pexec and not complete:
+                                break
+                        if found_full_pexec and not complete:
+                            break
+                    if found_full_pexec and not complete:
+                        break
+                elif field in ('audit', 'window_size'):
+                    values[field] = stream.read_value()
+                else:
+                    stream.skip_value()
+    machine = None
+    uname = values.get('audit', dict()).get('uname', '').split(' ')
+    if len(uname) > 1:
+        machine = uname[1]
+    return {'keys': sorted(lengths),
+            'pexecs': dict((key, len(lengths[key])) for key in lengths),
+            'iterations': lengths,
+            'machine': machine,
+            'stages': [stage for stage, field in _STAGE_FIELDS if field in fields],
+            'window_size': values.get('window_size')}
+
+
+def write_krun_results_file(results, filename, indent=4, jobs=1):
+    """Write a Krun results file to disk. If indent is None, the JSON is
+    written without pretty-printing. If jobs > 1, the file is written as a
+    series of bz2 streams, which are compressed in parallel by jobs threads.
+    """
+
+    write_krun_results_text(encode_krun_results(results, indent), filename, jobs)
+
+
+def array_to_list(value):
+    """Convert a NumPy array (e.g. a run sequence read from a results cache)
+    to a list. For use as the default function of json.dumps().
+    """
+    if numpy is not None and isinstance(value, numpy.ndarray):
+        return value.tolist()
+    raise TypeError('%r is not JSON serializable' % value)
+
+
+def encode_krun_results(results, indent=4):
+    """Return Krun results encoded as JSON, ready for write_krun_results_text()."""
+    with profiling.stage('json encode'):
+        return json.dumps(results, indent=indent, default=array_to_list)
+
+
+def write_krun_results_text(text, filename, jobs=1):
+    """Compress Krun results, already encoded as JSON, into a Krun results
+    file. Unlike JSON encoding, compression releases the GIL, so this can
+    usefully be run in another thread. See write_krun_results_file().
+
+    The file is written under a temporary name and then renamed, so that a
+    run which is killed part way through never leaves a truncated file (or
+    destroys an existing one).
+    """
+    tmp_file = filename + '.tmp'
+    with profiling.stage('bz2 encode'):
+        if jobs == 1 or len(text) <= _BZ2_STREAM_SIZE:
+            with bz2.BZ2File(tmp_file, 'wb') as file_:
+                file_.write(text)
+        else:
+            blocks = (text[start:start + _BZ2_STREAM_SIZE] for start in
+                      xrange(0, len(text), _BZ2_STREAM_SIZE))
+            pool = ThreadPool(jobs)
+            try:
+                with open(tmp_file, 'wb') as file_:
+                    for stream in pool.imap(bz2.compress, blocks):
+                        file_.write(stream)
+            finally:
+                pool.close()
+                pool.join()
+        os.rename(tmp_file, filename)
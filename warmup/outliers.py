@@ -1,10 +1,26 @@
 """Outlier calculations.
-These functions are designed to be executed by PyPy, and may run slowly with
-other VMs.
+These functions were originally designed to be executed by PyPy. The sliding
+window used by get_all_outliers() is now maintained incrementally, so CPython
+is no longer prohibitively slow. get_all_outliers_batch() uses NumPy (when
+available) to process all process executions of a benchmark at once, and
+get_all_outliers_approx() uses NumPy to approximate the percentiles of very
+large windows.
 """
 
+import bisect
 import math
 
+from collections import Counter
+
+try:
+    import numpy
+    from numpy.lib.stride_tricks import as_strided
+except ImportError:  # NumPy may not be available under PyPy.
+    numpy = None
+
+# Maximum number of array elements get_all_outliers_batch() copies at once.
+BATCH_MAX_ELEMENTS = 2 ** 22
+
 
 def _clamp_window_size(index, data_size, window_size=200):
     """Return the window of data which should be used to calculate a moving
@@ -57,24 +73,301 @@ def _tukey_all_outliers(data, window_size):
     return all_outliers
 
 
+def _sliding_tukey_all_outliers(data, window_size):
+    """Equivalent to _tukey_all_outliers(), but much faster for large windows.
+    Rather than copying and re-sorting the window for every iteration, we keep
+    one sorted copy of the window and slide it along the run sequence: data
+    points entering the window are inserted with a binary search, and data
+    points leaving it are found with a binary search and deleted. The median
+    and percentiles are then read directly from the sorted window, so the
+    result is identical to _tukey_all_outliers().
+    """
+    all_outliers = list()
+    size = len(data)
+    window_sorted = list()
+    # data[lh_window:rh_window] is the data currently held in window_sorted.
+    lh_window, rh_window = 0, 0
+    for index, datum in enumerate(data):
+        l_slice, r_slice = _clamp_window_size(index, size, window_size)
+        if l_slice == 0 and r_slice < window_size:
+            continue
+        # Both edges of the window only ever move rightwards.
+        while rh_window < r_slice:
+            bisect.insort(window_sorted, data[rh_window])
+            rh_window += 1
+        while lh_window < l_slice:
+            del window_sorted[bisect.bisect_left(window_sorted, data[lh_window])]
+            lh_window += 1
+        window_median = median(window_sorted)
+        pc_band = 3 * (percentile(window_sorted, 90.0) - percentile(window_sorted, 10.0))
+        if datum > (window_median + pc_band) or datum < (window_median - pc_band):
+            all_outliers.append(index)
+    return all_outliers
+
+
 def get_all_outliers(data, window_size):
-    return _tukey_all_outliers(data, window_size)
+    if hasattr(data, 'tolist'):  # A NumPy array, e.g. read from a results cache.
+        data = data.tolist()
+    return _sliding_tukey_all_outliers(data, window_size)
+
+
+def _batch_needed_ranks(size):
+    """Return the sorted ranks which _batch_median() and _batch_percentile()
+    read from a window of the given size.
+    """
+    if size == 1:
+        return [0]
+    ranks = set([(size - 1) // 2])
+    if size % 2 == 0:
+        ranks.add((size - 1) // 2 + 1)
+    for pc in (10.0, 90.0):
+        index = (size - 1) * (pc / 100.0)
+        ranks.add(int(math.floor(index)))
+        ranks.add(int(math.ceil(index)))
+    return sorted(ranks)
+
+
+def _batch_median(parted, size):
+    """As median(), but for every window along the last axis of parted."""
+    if size == 1:
+        return parted[..., 0]
+    index = (size - 1) // 2
+    if size % 2 == 1:
+        return parted[..., index]
+    else:
+        return (parted[..., index] + parted[..., index + 1]) / 2.0
+
+
+def _batch_percentile(parted, size, pc):
+    """As percentile(), but for every window along the last axis of parted."""
+    if size == 1:
+        return parted[..., 0]
+    index = (size - 1) * (pc / 100.0)
+    index_floor = math.floor(index)
+    index_ceil = math.ceil(index)
+    if index_floor == index_ceil:
+        return parted[..., int(index)]
+    d0 = parted[..., int(index_floor)] * (index_ceil - index)
+    d1 = parted[..., int(index_ceil)] * (index - index_floor)
+    return d0 + d1
+
+
+def _batch_tukey_outliers(windows, data):
+    """Return a boolean array, True where data (shape: rows x iterations) lies
+    outside the Tukey band of its window (shape: rows x iterations x size).
+    """
+    size = windows.shape[-1]
+    parted = numpy.partition(windows, _batch_needed_ranks(size), axis=-1)
+    window_median = _batch_median(parted, size)
+    pc_band = 3 * (_batch_percentile(parted, size, 90.0) - _batch_percentile(parted, size, 10.0))
+    return (data > (window_median + pc_band)) | (data < (window_median - pc_band))
+
+
+def _batch_tukey_all_outliers(p_execs, window_size):
+    """Vectorised equivalent of calling _tukey_all_outliers() on each row of
+    a 2D array of equal-length run sequences.
+
+    Every full-width window is a strided view onto the data, so the median
+    and percentiles of many windows are computed with one numpy.partition()
+    call. Windows are processed in chunks of at most BATCH_MAX_ELEMENTS
+    elements, so that memory stays bounded. Windows which are truncated at
+    the end of the run sequence have different sizes, and are dealt with one
+    size at a time. The arithmetic mirrors median() and percentile(), so the
+    outliers found are identical to _tukey_all_outliers().
+    """
+    n_rows, size = p_execs.shape
+    is_outlier = numpy.zeros(p_execs.shape, dtype=bool)
+    # Group the indices which need a window into runs with the same window
+    # size. Within a run, the left hand edge of the window moves one step
+    # rightwards for each index.
+    runs = list()  # [window size, first index, first lh edge, run length].
+    for index in xrange(size):
+        l_slice, r_slice = _clamp_window_size(index, size, window_size)
+        if l_slice == 0 and r_slice < window_size:
+            continue
+        width = r_slice - l_slice
+        if runs and runs[-1][0] == width and runs[-1][2] + runs[-1][3] == l_slice \
+                and runs[-1][1] + runs[-1][3] == index:
+            runs[-1][3] += 1
+        else:
+            runs.append([width, index, l_slice, 1])
+    row_stride, col_stride = p_execs.strides
+    for width, first_index, first_l_slice, length in runs:
+        if width == 0:
+            raise ValueError('Cannot compute percentile of empty list!')
+        chunk = max(1, BATCH_MAX_ELEMENTS // (n_rows * width))
+        for start in xrange(0, length, chunk):
+            n_windows = min(chunk, length - start)
+            offset = first_l_slice + start
+            windows = as_strided(p_execs[:, offset:], shape=(n_rows, n_windows, width),
+                                 strides=(row_stride, col_stride, col_stride))
+            index = first_index + start
+            data = p_execs[:, index:index + n_windows]
+            is_outlier[:, index:index + n_windows] = _batch_tukey_outliers(windows, data)
+    return is_outlier
+
+
+def get_all_outliers_batch(p_execs, window_size):
+    """Return a list of outliers for each run sequence in p_execs, exactly as
+    [get_all_outliers(p_exec, window_size) for p_exec in p_execs] would.
+    Run sequences of the same length are stacked into a 2D NumPy array and
+    processed together. Requires NumPy.
+    """
+    assert numpy is not None, 'get_all_outliers_batch() requires NumPy.'
+    all_outliers = [list() for _ in p_execs]
+    by_length = dict()  # Run sequence length -> indices of p_execs.
+    for index, p_exec in enumerate(p_execs):
+        if len(p_exec) > 0:  # Crashed process executions have no outliers.
+            by_length.setdefault(len(p_exec), list()).append(index)
+    for length in by_length:
+        indices = by_length[length]
+        stacked = numpy.array([p_execs[index] for index in indices], dtype=numpy.float64)
+        is_outlier = _batch_tukey_all_outliers(stacked, window_size)
+        for row, index in enumerate(indices):
+            all_outliers[index] = [int(i) for i in numpy.flatnonzero(is_outlier[row])]
+    return all_outliers
+
+
+def _approx_parameters(window_size, error):
+    """Return the (block size, group size) used by get_all_outliers_approx()
+    to keep the rank error of each percentile below roughly error *
+    window_size, or None if the window is too small to be worth approximating.
+    A third of the error is allowed for each of the two edges of the window,
+    and a third for sampling the blocks.
+    """
+    block = int(error * window_size / 6)
+    if block < 2:
+        return None
+    n_blocks = window_size // block + 2  # Most blocks in (or near) one window.
+    max_group = 1 + int(error * window_size / 3 / n_blocks)
+    group = max(size for size in xrange(1, min(block, max_group) + 1) if block % size == 0)
+    return block, group
+
+
+def _block_sample(data, start, end, group):
+    """Return the largest value of each group of group values in
+    sorted(data[start:end]). A partial final group is dropped.
+    """
+    return numpy.sort(data[start:end])[group - 1::group]
+
+
+def get_all_outliers_approx(data, window_size, error):
+    """Approximate get_all_outliers() for large windows, using quantiles
+    whose rank error is at most roughly error * window_size. Requires NumPy.
+
+    The run sequence is split into fixed size blocks, and the window of each
+    iteration is approximated by the blocks whose midpoints lie in it. Each
+    block is summarised by a sorted sample of its values (a mergeable
+    quantile sketch), and the samples of a window are merged to find its
+    median and percentiles. The approximate window, and so the percentiles,
+    only change every few iterations, and only the samples of blocks in the
+    current window are kept in memory.
+
+    Returns a pair (outliers, uncertain), where uncertain is the number of
+    iterations whose outlier decision might differ from get_all_outliers(),
+    because the data point lies within the rank error of the edge of the
+    Tukey band. Windows which are too small to approximate (see
+    _approx_parameters()) are computed exactly, with no uncertain decisions.
+    """
+    assert numpy is not None, 'get_all_outliers_approx() requires NumPy.'
+    size = len(data)
+    parameters = _approx_parameters(window_size, error)
+    if parameters is None or size == 0:
+        return get_all_outliers(data, window_size), 0
+    block, group = parameters
+    data = numpy.asarray(data, dtype=numpy.float64)
+    # The exact window of each index, as in _clamp_window_size(), skipping
+    # indices without a full first window.
+    half_window = window_size // 2
+    indices = numpy.arange(size)
+    lh_indices = numpy.maximum(indices - half_window, 0)
+    rh_indices = numpy.minimum(indices + half_window, size)
+    valid = ~((lh_indices == 0) & (rh_indices < window_size))
+    indices, lh_indices, rh_indices = indices[valid], lh_indices[valid], rh_indices[valid]
+    if len(indices) == 0:
+        return list(), 0
+    # Blocks first_block[i]:last_block[i] approximate the window of indices[i].
+    starts = numpy.arange(0, size, block)
+    ends = numpy.minimum(starts + block, size)
+    midpoints2 = starts + ends - 1  # Twice the midpoint of each block.
+    first_block = numpy.searchsorted(midpoints2, 2 * lh_indices, 'left')
+    last_block = numpy.searchsorted(midpoints2, 2 * rh_indices - 2, 'right')
+    changes = numpy.flatnonzero((numpy.diff(first_block) != 0) |
+                                (numpy.diff(last_block) != 0)) + 1
+    run_starts = [0] + [int(change) for change in changes]
+    run_ends = run_starts[1:] + [len(indices)]
+    is_outlier = numpy.zeros(len(indices), dtype=bool)
+    uncertain = 0
+    # The sorted samples of blocks first:last, updated as blocks enter and
+    # leave the window (both edges of which only ever move rightwards).
+    samples = dict()  # Block number -> sample.
+    merged = numpy.zeros(0)
+    first, last = 0, 0
+    for run_start, run_end in zip(run_starts, run_ends):
+        new_first, new_last = int(first_block[run_start]), int(last_block[run_start])
+        assert new_last > new_first, 'Window too small for its blocks.'
+        for number in xrange(first, min(new_first, last)):
+            leaving = samples.pop(number)
+            positions = numpy.searchsorted(merged, leaving, 'left')
+            # Equal values must be deleted from consecutive positions.
+            positions += numpy.arange(len(leaving)) - numpy.searchsorted(leaving, leaving, 'left')
+            merged = numpy.delete(merged, positions)
+        for number in xrange(max(new_first, last), new_last):
+            samples[number] = _block_sample(data, starts[number], ends[number], group)
+            merged = numpy.insert(merged, numpy.searchsorted(merged, samples[number]),
+                                  samples[number])
+        first, last = new_first, new_last
+        # Number of data points which differ between the exact windows of
+        # this run and the approximate window. Each such data point can move
+        # a rank by one, as can the change in the size of the window.
+        edges = numpy.abs(lh_indices[run_start:run_end] - starts[first]) + \
+            numpy.abs(rh_indices[run_start:run_end] - ends[last - 1])
+        # Each sample (and a dropped partial group) adds under group ranks.
+        slack = 2 * int(edges.max()) + (last - first + 1) * (group - 1)
+        n_ranks = len(merged) * group
+        estimate, lower, upper = dict(), dict(), dict()
+        for pc in (10.0, 50.0, 90.0):
+            index = (n_ranks - 1) * (pc / 100.0)
+            index_floor, index_ceil = int(math.floor(index)), int(math.ceil(index))
+            d0, d1 = merged[index_floor // group], merged[index_ceil // group]
+            if index_floor == index_ceil:
+                estimate[pc] = d0
+            else:
+                estimate[pc] = d0 * (index_ceil - index) + d1 * (index - index_floor)
+            # The exact percentile lies between these values.
+            lower[pc] = merged[max(0, index_floor - slack) // group]
+            upper[pc] = merged[min(n_ranks - 1, index_ceil + slack) // group]
+        window_median = estimate[50.0]
+        pc_band = 3 * (estimate[90.0] - estimate[10.0])
+        run_data = data[indices[run_start:run_end]]
+        is_outlier[run_start:run_end] = ((run_data > (window_median + pc_band)) |
+                                         (run_data < (window_median - pc_band)))
+        # The exact edges of the Tukey band lie within these ranges.
+        band_low = 3 * (lower[90.0] - upper[10.0])
+        band_high = 3 * (upper[90.0] - lower[10.0])
+        uncertain += int(numpy.count_nonzero(
+            ((run_data >= lower[50.0] + band_low) & (run_data <= upper[50.0] + band_high)) |
+            ((run_data >= lower[50.0] - band_high) & (run_data <= upper[50.0] - band_low))))
+    return [int(index) for index in indices[is_outlier]], uncertain
 
 
 def get_outliers(all_outliers, window_size, threshold=1):
     """Return 'common' and 'unique' outliers.
+    An outlier is common if it also appears in at least threshold other
+    process executions, and unique otherwise. We count, once, the number of
+    process executions each iteration index is an outlier in, so that each
+    outlier can then be classified with a single lookup.
     """
+    pexec_counts = Counter()  # Iteration index -> number of pexecs.
+    for outliers in all_outliers:
+        pexec_counts.update(set(outliers))
     common, unique = list(), list()
-    for index, outliers in enumerate(all_outliers):
+    for outliers in all_outliers:
         common_exec = list()
         unique_exec = list()
         for outlier in outliers:
-            other_execs = all_outliers[:index] + all_outliers[(index + 1):]
-            sum_ = 0
-            for execution in other_execs:
-                if outlier in execution:
-                    sum_ += 1
-            if sum_ >= threshold:
+            # Do not count this process execution.
+            if pexec_counts[outlier] - 1 >= threshold:
                 common_exec.append(outlier)
             else:
                 unique_exec.append(outlier)
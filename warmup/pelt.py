@@ -0,0 +1,211 @@
+"""A pure Python / NumPy implementation of the PELT changepoint algorithm.
+
+This is a port of the PELT search and the normal "meanvar" cost function from
+the R changepoint library (which bin/mark_changepoints_in_json otherwise calls
+through rpy2). It follows the C implementation in the changepoint library
+step by step: candidate changepoints are considered in the same order, ties
+are broken in the same way and the same minimum segment length is enforced.
+The only differences from R should be floating point rounding.
+"""
+
+import math
+import numpy
+
+# Identifies this implementation, e.g. in caches of changepoint results.
+# Change it whenever a change to this module may change its results.
+VERSION = '1'
+
+# Default minimum segment length used by cpt.meanvar() in R.
+MINSEGLEN = 2
+
+# The changepoint library replaces zero (or negative, due to rounding)
+# variances with this value, so that the log-likelihood is defined.
+_MIN_VARIANCE = 0.00000000001
+
+_LOG_2PI = math.log(2 * math.pi)
+
+
+def _meanvar_norm_cost(sum_x, sum_x2, n):
+    """Twice the negative log-likelihood of a segment of n normally
+    distributed data points, with unknown mean and variance, given the sum
+    and sum of squares of the segment. Works on scalars or NumPy arrays.
+    """
+    sigsq = (sum_x2 - ((sum_x * sum_x) / n)) / n
+    sigsq = numpy.where(sigsq <= 0, _MIN_VARIANCE, sigsq)
+    return n * (_LOG_2PI + numpy.log(sigsq) + 1)
+
+
+def pelt_meanvar_norm(data, penalty, minseglen=MINSEGLEN):
+    """Find changes in the mean and variance of data, assumed to be normally
+    distributed, with PELT. penalty is the (manual) penalty added for each
+    changepoint.
+
+    As with the cpts slot of the object returned by cpt.meanvar() in R, the
+    changepoints returned here are 1-indexed, and the last changepoint is
+    always the length of the data.
+    """
+    data = numpy.asarray(data, dtype=numpy.float64)
+    size = len(data)
+    sum_x = numpy.concatenate(([0.0], numpy.cumsum(data)))
+    sum_x2 = numpy.concatenate(([0.0], numpy.cumsum(data * data)))
+    # Cost of the optimal segmentation of data[:tstar], and the last
+    # changepoint in that segmentation.
+    last_change_like = numpy.zeros(size + 1)
+    last_change_cpts = numpy.zeros(size + 1, dtype=int)
+    last_change_like[0] = -penalty
+    for tstar in xrange(minseglen, min(2 * minseglen, size + 1)):
+        last_change_like[tstar] = _meanvar_norm_cost(sum_x[tstar], sum_x2[tstar], tstar)
+    checklist = numpy.array([0, minseglen], dtype=int)
+    for tstar in xrange(2 * minseglen, size + 1):
+        tmp_like = (last_change_like[checklist] +
+                    _meanvar_norm_cost(sum_x[tstar] - sum_x[checklist],
+                                       sum_x2[tstar] - sum_x2[checklist],
+                                       tstar - checklist) +
+                    penalty)
+        which_out = numpy.argmin(tmp_like)  # Ties go to the first candidate.
+        last_change_like[tstar] = tmp_like[which_out]
+        last_change_cpts[tstar] = checklist[which_out]
+        # Prune candidates which can never be optimal, and add the next one.
+        checklist = numpy.append(checklist[tmp_like <= last_change_like[tstar] + penalty],
+                                 tstar - (minseglen - 1))
+    cpts = list()
+    last = size
+    while last != 0:
+        cpts.append(int(last))
+        last = last_change_cpts[last]
+    cpts.reverse()
+    return cpts
+
+
+def optimal_partition_meanvar_norm(data, penalty, candidates, minseglen=MINSEGLEN):
+    """Return the optimal segmentation of data (as pelt_meanvar_norm() does)
+    whose changepoints are all among candidates, a sorted list of 1-indexed
+    changepoints which must include the length of the data. Candidates are
+    pruned as in PELT.
+    """
+    data = numpy.asarray(data, dtype=numpy.float64)
+    sum_x = numpy.concatenate(([0.0], numpy.cumsum(data)))
+    sum_x2 = numpy.concatenate(([0.0], numpy.cumsum(data * data)))
+    candidates = numpy.asarray(candidates, dtype=int)
+    # As in pelt_meanvar_norm(), but indexed by position in candidates, with
+    # position 0 standing for the start of the data.
+    ends = numpy.concatenate(([0], candidates))
+    last_change_like = numpy.zeros(len(ends))
+    last_change_cpts = numpy.zeros(len(ends), dtype=int)
+    last_change_like[0] = -penalty
+    checklist = numpy.array([0], dtype=int)
+    for position in xrange(1, len(ends)):
+        tstar = ends[position]
+        valid = checklist[tstar - ends[checklist] >= minseglen]
+        if len(valid) == 0:
+            # Too close to every candidate to end a segment; never optimal.
+            last_change_like[position] = numpy.inf
+            checklist = numpy.append(checklist, position)
+            continue
+        tmp_like = (last_change_like[valid] +
+                    _meanvar_norm_cost(sum_x[tstar] - sum_x[ends[valid]],
+                                       sum_x2[tstar] - sum_x2[ends[valid]],
+                                       tstar - ends[valid]) +
+                    penalty)
+        which_out = numpy.argmin(tmp_like)
+        last_change_like[position] = tmp_like[which_out]
+        last_change_cpts[position] = valid[which_out]
+        keep = numpy.ones(len(checklist), dtype=bool)
+        keep[numpy.searchsorted(checklist, valid)] = (tmp_like <=
+                                                      last_change_like[position] + penalty)
+        checklist = numpy.append(checklist[keep], position)
+    cpts = list()
+    position = len(ends) - 1
+    while position != 0:
+        cpts.append(int(ends[position]))
+        position = last_change_cpts[position]
+    cpts.reverse()
+    return cpts
+
+
+def segmentation_cost(data, cpts):
+    """Return the cost (without penalties) of segmenting data at the 1-indexed
+    changepoints cpts, as returned by pelt_meanvar_norm().
+    """
+    data = numpy.asarray(data, dtype=numpy.float64)
+    sum_x = numpy.concatenate(([0.0], numpy.cumsum(data)))
+    sum_x2 = numpy.concatenate(([0.0], numpy.cumsum(data * data)))
+    ends = numpy.asarray(cpts, dtype=int)
+    starts = numpy.concatenate(([0], ends[:-1]))
+    return float(numpy.sum(_meanvar_norm_cost(sum_x[ends] - sum_x[starts],
+                                              sum_x2[ends] - sum_x2[starts],
+                                              ends - starts)))
+
+
+def penalty_envelope(data, all_cpts, pen_min):
+    """Given several segmentations of data (lists of 1-indexed changepoints),
+    return the segmentations which are optimal for some penalty of at least
+    pen_min, as a list of (penalty, cpts) pairs in increasing order of
+    penalty. Each segmentation is optimal from its penalty up to the penalty
+    of the next.
+    """
+    found = dict()  # Number of changepoints -> (cost, cpts).
+    for cpts in all_cpts:
+        if len(cpts) not in found:
+            found[len(cpts)] = (segmentation_cost(data, cpts), cpts)
+    envelope = list()  # (penalty, cpts, cost) triples.
+    for size in sorted(found, reverse=True):
+        cost, cpts = found[size]
+        penalty = pen_min
+        while envelope:
+            last_penalty, last_cpts, last_cost = envelope[-1]
+            # The penalty at which cpts becomes as good as the last segmentation.
+            penalty = (cost - last_cost) / (len(last_cpts) - size)
+            if penalty > last_penalty:
+                break
+            envelope.pop()  # The last segmentation is never optimal.
+            penalty = pen_min
+        envelope.append((penalty, cpts, cost))
+    return [(penalty, cpts) for penalty, cpts, _ in envelope]
+
+
+def crops_meanvar_norm(data, pen_min, pen_max, minseglen=MINSEGLEN):
+    """Find the optimal segmentations of data (see pelt_meanvar_norm()) for
+    every penalty between pen_min and pen_max, with the CROPS algorithm of
+    Haynes, Eckley and Fearnhead (2017). PELT is run once for each distinct
+    segmentation, plus at most once for each boundary between them, rather
+    than for every penalty of interest. Returns a list of (penalty, cpts)
+    pairs, as penalty_envelope() does.
+    """
+    data = numpy.asarray(data, dtype=numpy.float64)
+    all_cpts = list()
+
+    def run(penalty):
+        cpts = pelt_meanvar_norm(data, penalty, minseglen)
+        all_cpts.append(cpts)
+        return len(cpts), segmentation_cost(data, cpts)
+
+    intervals = [((pen_min, run(pen_min)), (pen_max, run(pen_max)))]
+    while intervals:
+        (low, (low_size, low_cost)), (high, (high_size, high_cost)) = intervals.pop()
+        if low_size <= high_size + 1:
+            continue  # There is no segmentation in between.
+        # Both segmentations are equally good at pen_int. Another segmentation
+        # is optimal between them only if it is better still at pen_int.
+        pen_int = (high_cost - low_cost) / (low_size - high_size)
+        size, cost = run(pen_int)
+        if high_size < size < low_size:
+            intervals.append(((low, (low_size, low_cost)), (pen_int, (size, cost))))
+            intervals.append(((pen_int, (size, cost)), (high, (high_size, high_cost))))
+    return penalty_envelope(data, all_cpts, pen_min)
+
+
+def segment_means_variances(data, cpts):
+    """Return the mean and (maximum likelihood) variance of each segment of
+    data, given 1-indexed changepoints as returned by pelt_meanvar_norm().
+    These match the param.est slot of a cpt.meanvar() object in R.
+    """
+    means, variances = list(), list()
+    start = 0
+    for end in cpts:
+        segment = data[start:end]
+        mean = math.fsum(segment) / len(segment)
+        means.append(mean)
+        variances.append(math.fsum([(datum - mean) ** 2 for datum in segment]) / len(segment))
+        start = end
+    return means, variances
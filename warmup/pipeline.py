@@ -0,0 +1,666 @@
+"""Stages of the warmup_stats pipeline, run on Krun results held in memory.
+
+Each stage takes Krun results (as returned by read_krun_results_file()) and
+annotates them in place, so that stages can be chained without writing (and
+re-reading) a results file after each one. bin/mark_outliers_in_json and
+bin/mark_changepoints_in_json run a single stage over results files, and
+bin/warmup_stats chains the stages, only writing out the final results (and
+any intermediate results which the user asked for).
+
+Stages therefore hold whole results files in memory. The streaming readers
+in warmup.krun_results (iter_krun_results() and read_krun_results_fields())
+are only used by read-only tools, such as plot_krun_results --benchmark. When
+marking large files, --use-cache reduces memory use instead, by memory-mapping
+run sequences from the results cache.
+
+The changepoint stages need NumPy, so warmup.changepoints is only imported
+when they run: the outliers stage must still work without NumPy (e.g. under
+PyPy, which bin/mark_outliers_in_json prefers).
+"""
+
+import Queue
+import itertools
+import multiprocessing
+import os.path
+import sys
+import threading
+
+from warmup import profiling
+from warmup.journal import Journal
+from warmup.outliers import get_all_outliers, get_all_outliers_approx, get_all_outliers_batch
+from warmup.outliers import get_outliers
+from warmup.stage_cache import StageCache
+
+
+def _split_filename(in_file_name):
+    directory = os.path.dirname(in_file_name)
+    basename = os.path.basename(in_file_name)
+    if basename.endswith('.json.bz2'):
+        root_name = basename[:-9]
+    else:
+        root_name = os.path.splitext(basename)[0]
+    return directory, root_name
+
+
+def outliers_filename(in_file_name, window_size):
+    """Name of the file written by the outliers stage for in_file_name."""
+    directory, root_name = _split_filename(in_file_name)
+    base_out = (root_name + '_outliers_w%g.json.bz2') % window_size
+    return os.path.join(directory, base_out)
+
+
+def changepoints_filename(in_file_name):
+    """Name of the file written by the changepoints stage for in_file_name."""
+    directory, root_name = _split_filename(in_file_name)
+    base_out = root_name + '_changepoints.json.bz2'
+    return os.path.join(directory, base_out)
+
+
+def reclassified_filename(in_file_name, delta, steady_state, raw_deltas, penalty=None):
+    """Name of the file written by reclassify() for in_file_name. The name
+    records the classifier options (and penalty, if one was picked), so that
+    the files written by a sweep over several options do not overwrite each
+    other.
+    """
+    directory, root_name = _split_filename(in_file_name)
+    base_out = root_name + '_reclassified_d%s_s%d%s%s.json.bz2' % \
+        (str(delta).replace('%', 'pc'), steady_state, '_raw' if raw_deltas else '',
+         '' if penalty is None else '_p%g' % penalty)
+    return os.path.join(directory, base_out)
+
+
+# Timeout for blocking queue operations. In Python 2, a blocking get() with
+# no timeout cannot be interrupted by Ctrl-C.
+_QUEUE_TIMEOUT = 365 * 24 * 60 * 60
+
+
+def process_files_pipelined(filenames, read, process, write, in_memory=3):
+    """Call read(filename), then process(filename, data) and write(filename,
+    data) with the data returned by read(), for each of filenames in order.
+    Files are read and written in their own threads, so that the next file
+    can be read (and the previous file written) while this one is processed.
+    No more than in_memory files are held in memory at once. Exceptions
+    raised by read() or write() are re-raised in the calling thread. Files
+    which have already been processed are written before this function
+    returns (or raises), unless write() itself fails.
+    """
+    slots = threading.Semaphore(in_memory)  # Released when a file is written.
+    stop = threading.Event()
+    to_process, to_write = Queue.Queue(), Queue.Queue()
+    errors = list()  # sys.exc_info() of the first exception in a thread.
+
+    def reader():
+        try:
+            for filename in filenames:
+                slots.acquire()
+                if stop.is_set():
+                    return
+                try:
+                    to_process.put((filename, read(filename)))
+                except Exception:
+                    errors.append(sys.exc_info())
+                    return
+        finally:
+            to_process.put(None)
+
+    def writer():
+        while True:
+            item = to_write.get(True, _QUEUE_TIMEOUT)
+            if item is None:
+                return
+            if not errors:
+                try:
+                    write(*item)
+                except Exception:
+                    errors.append(sys.exc_info())
+                    stop.set()
+            slots.release()
+
+    threads = [threading.Thread(target=reader), threading.Thread(target=writer)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    try:
+        while not errors:
+            item = to_process.get(True, _QUEUE_TIMEOUT)
+            if item is None:
+                break
+            process(*item)
+            to_write.put(item)
+    finally:
+        stop.set()
+        slots.release()  # Wake the reader, if it is waiting for a free slot.
+        to_write.put(None)
+        for thread in threads:
+            thread.join(_QUEUE_TIMEOUT)
+    if errors:
+        raise errors[0][0], errors[0][1], errors[0][2]
+
+
+def _as_list(value):
+    # Run sequences read from a results cache may be NumPy arrays.
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    return value
+
+
+def _matching_prefix(old_lists, new_lists):
+    """Return the length of the longest prefix on which every list in
+    old_lists is equal to the corresponding list in new_lists.
+    """
+    limit = min(len(values) for values in old_lists + new_lists)
+    count = 0
+    while count < limit and all(_as_list(old[count]) == _as_list(new[count])
+                                for old, new in zip(old_lists, new_lists)):
+        count += 1
+    return count
+
+
+def _classify_stored(bench, p_execs, outliers, segmentation, delta, steady_state,
+                     raw_deltas):
+    """Return the classifications of the leading process executions of
+    bench, whose segmentation (a dictionary of SEGMENTATION_FIELDS) was
+    stored by an earlier run of the changepoints stage. Crashed process
+    executions (which have no iterations) have a classification of None.
+    Raises ValueError if any other process execution cannot be classified.
+    """
+    from warmup.changepoints import classify_segmentation
+    classifications = list()
+    for index in xrange(len(segmentation['changepoints'])):
+        if len(p_execs[index]) == 0:
+            classifications.append(None)
+            continue
+        with profiling.stage('classification', bench):
+            classification = classify_segmentation(delta, steady_state, p_execs[index],
+                                                   outliers[index],
+                                                   segmentation['changepoints'][index],
+                                                   segmentation['changepoint_means'][index],
+                                                   segmentation['changepoint_vars'][index],
+                                                   raw_deltas)
+        if classification is None:
+            raise ValueError('Could not classify %s execution %d' % (bench, index + 1))
+        classifications.append(classification)
+    return classifications
+
+
+def _bench_outliers(results, bench):
+    """Return the outliers of each process execution of bench, or empty
+    lists if outliers have not been marked.
+    """
+    if 'all_outliers' in results:
+        return results['all_outliers'].get(bench, [])
+    return [list() for _ in results['wallclock_times'].get(bench, [])]
+
+
+def mark_outliers(results, window_size, threshold, batch=False, stage_cache_dir=None,
+                  previous=None, approx_error=None, journal_file=None, resume=False):
+    """Annotate all_outliers, common_outliers and unique_outliers (and the
+    window_size used) into results. If batch is True, NumPy is used to find
+    the outliers in all process executions of a benchmark at once. If
+    stage_cache_dir is not None, outliers are reused from (and saved to) a
+    StageCache in that directory.
+
+    If approx_error is not None, the percentiles of each window are
+    approximated (see get_all_outliers_approx()) with a rank error of at most
+    roughly approx_error * window_size, which is recorded in results as
+    outliers_approx_error. The number of outlier decisions which might
+    differ from the exact method is printed.
+
+    previous may be Krun results annotated by an earlier run of this stage
+    (e.g. before more process executions were appended to a results file).
+    Outliers are then only computed for process executions which are not in
+    previous, or whose data has changed; common and unique outliers are
+    always recomputed.
+
+    If journal_file is not None, the outliers of each benchmark are appended
+    to a Journal in that file as soon as they are found. If resume is also
+    True, benchmarks already in the journal are not processed again.
+    """
+    parameters = {'window_size': window_size, 'threshold': threshold}
+    if approx_error is not None:
+        parameters['approx_error'] = approx_error
+    stage_cache = None
+    if stage_cache_dir is not None:
+        stage_cache = StageCache(stage_cache_dir, 'outliers', parameters)
+    journal = None
+    if journal_file is not None:
+        journal = Journal(journal_file, 'outliers', parameters, resume)
+    if previous is not None and (previous.get('window_size') != window_size or
+                                 previous.get('outliers_approx_error') != approx_error):
+        print('Previous outliers used a different window size or approximation; '
+              'recomputing all outliers.')
+        previous = None
+    results['window_size'] = window_size
+    results.pop('outliers_approx_error', None)
+    if approx_error is not None:
+        results['outliers_approx_error'] = approx_error
+    all_outliers = dict()
+    unique_outliers = dict()
+    common_outliers = dict()
+    reused_pexecs, total_pexecs = 0, 0
+    uncertain, decisions = 0, 0
+    for bench in results['wallclock_times']:
+        if journal is not None:
+            journal_digest = journal.digest(results['wallclock_times'][bench])
+            journalled = journal.get(bench, journal_digest)
+            if journalled is not None:
+                all_outliers[bench] = journalled['all_outliers']
+                common_outliers[bench] = journalled['common_outliers']
+                unique_outliers[bench] = journalled['unique_outliers']
+                continue
+        if stage_cache is not None:
+            digest = stage_cache.digest(results['wallclock_times'][bench])
+            cached = stage_cache.get(digest)
+            if cached is not None:
+                all_outliers[bench] = cached['all_outliers']
+                common_outliers[bench] = cached['common_outliers']
+                unique_outliers[bench] = cached['unique_outliers']
+                continue
+        p_execs = results['wallclock_times'][bench]
+        reused = 0
+        if previous is not None and bench in previous.get('all_outliers', {}):
+            old_outliers = previous['all_outliers'][bench]
+            reused = min(len(old_outliers),
+                         _matching_prefix([previous['wallclock_times'].get(bench, [])], [p_execs]))
+            all_outliers[bench] = old_outliers[:reused]
+        else:
+            all_outliers[bench] = list()
+        reused_pexecs += reused
+        total_pexecs += len(p_execs)
+        with profiling.stage('outliers', bench):
+            if approx_error is not None:
+                for p_exec in p_execs[reused:]:
+                    outliers, pexec_uncertain = get_all_outliers_approx(p_exec, window_size,
+                                                                        approx_error)
+                    all_outliers[bench].append(outliers)
+                    uncertain += pexec_uncertain
+                    decisions += len(p_exec)
+            elif batch:
+                all_outliers[bench].extend(get_all_outliers_batch(p_execs[reused:], window_size))
+            else:
+                for p_exec in p_execs[reused:]:
+                    all_outliers[bench].append(get_all_outliers(p_exec, window_size))
+            common, unique = get_outliers(all_outliers[bench], window_size, threshold)
+        common_outliers[bench] = common
+        unique_outliers[bench] = unique
+        if stage_cache is not None:
+            stage_cache.put(digest, {'all_outliers': all_outliers[bench],
+                                     'common_outliers': common,
+                                     'unique_outliers': unique})
+        if journal is not None:
+            journal.put(bench, journal_digest, {'all_outliers': all_outliers[bench],
+                                                'common_outliers': common,
+                                                'unique_outliers': unique})
+    if journal is not None:
+        journal.close()
+        if resume:
+            print('Resume: reused outliers for %d benchmark(s) from %s.' %
+                  (journal.resumed, journal.filename))
+    results['all_outliers'] = all_outliers
+    results['common_outliers'] = common_outliers
+    results['unique_outliers'] = unique_outliers
+    if stage_cache is not None:
+        print('Stage cache: reused outliers for %d benchmark(s), computed %d.' %
+              (stage_cache.hits, stage_cache.misses))
+    if previous is not None:
+        print('Incremental: reused outliers for %d of %d process execution(s).' %
+              (reused_pexecs, total_pexecs))
+    if approx_error is not None:
+        print('Approximate percentiles: %d of %d outlier decision(s) might differ from '
+              'the exact method.' % (uncertain, decisions))
+
+
+def _set_segmenter(results, penalty, penalty_range, chunks=None):
+    """Record the changepoint penalty and chunk options in results, unless
+    they are the defaults.
+    """
+    from warmup.changepoints import PENALTY
+    results.pop('changepoint_penalty', None)
+    results.pop('changepoint_penalty_range', None)
+    results.pop('changepoint_chunks', None)
+    if penalty != PENALTY or penalty_range is not None:
+        results['changepoint_penalty'] = penalty
+    if penalty_range is not None:
+        results['changepoint_penalty_range'] = list(penalty_range)
+    if chunks is not None:
+        results['changepoint_chunks'] = list(chunks)
+
+
+def mark_changepoints(all_results, delta, steady_state, raw_deltas, jobs=1,
+                      backend='r', stage_cache_dir=None, previous=None,
+                      penalty=None, penalty_range=None, chunks=None, journal_files=None,
+                      resume=False, r_batch=False):
+    """Annotate changepoints, segment means and variances, classifications and
+    the classifier options into each of a list of Krun results. Outliers (if
+    they have been marked) are excluded from the changepoint analysis.
+
+    Every process execution is segmented independently, in jobs worker
+    processes if jobs > 1. With the R backend, each process execution is
+    sent to R separately, unless r_batch is True, in which case the process
+    executions of each benchmark are sent to R in one call. This has not yet
+    been checked against R (see test/check_r_backend.py), so is off by
+    default. If stage_cache_dir is not
+    None, segmentations are reused from (and saved to) a StageCache in that
+    directory. Crashed process executions (which have no iterations) are not
+    segmented: like the outliers stage, their changepoints, segment means and
+    variances are empty, and their classification is None. Raises ValueError
+    if any other process execution cannot be classified.
+
+    penalty is the penalty for each changepoint, as a multiple of the log of
+    the number of iterations (by default, warmup.changepoints.PENALTY). If
+    penalty_range (a (minimum, maximum) pair of such multiples) is not None,
+    the optimal segmentations for every penalty in the range are also
+    annotated into results, as changepoint_sweeps, and the one for penalty
+    is used. Use reclassify() to pick another penalty later. penalty_range
+    can only be used with the python backend.
+
+    If chunks is not None, it is a (chunk size, overlap) pair. Each process
+    execution with more than chunk size iterations (excluding outliers) is
+    split into windows of chunk size iterations, overlapping by overlap
+    iterations. Windows are segmented independently (in jobs worker
+    processes, if jobs > 1), and their changepoints reconciled (see
+    warmup.changepoints.reconcile_chunks()). chunks can only be used with
+    the python backend, and not with penalty_range.
+
+    journal_files may be a list (parallel to all_results) of file names, or
+    None. The segmentation of each benchmark is appended to a Journal in the
+    corresponding file as soon as it is computed. If resume is also True,
+    benchmarks already in a journal are not segmented again.
+
+    previous may be a list (parallel to all_results) of Krun results, or None,
+    annotated by an earlier run of this stage. Process executions whose data
+    and outliers are unchanged in previous reuse its segmentation, provided
+    that it used the same penalty options. previous does not record the
+    backend, which callers must keep the same.
+
+    Segmentations do not depend on delta, steady_state or raw_deltas, so
+    those which are reused are classified again with the current options.
+    """
+    from warmup.changepoints import PENALTY, SEGMENTATION_FIELDS, SWEEP_FIELD
+    from warmup.changepoints import backend_version, init_segments_worker, segments_worker
+    from warmup.changepoints import get_chunk_jobs, reconcile_chunks, window_worker
+    if penalty is None:
+        penalty = PENALTY
+    if chunks is not None and penalty_range is not None:
+        raise ValueError('Chunks cannot be used with a penalty range.')
+    if penalty_range is not None and backend != 'python':
+        raise ValueError('A penalty range can only be used with the python backend.')
+    if chunks is not None and backend != 'python':
+        raise ValueError('Chunks can only be used with the python backend.')
+    fields = list(SEGMENTATION_FIELDS)
+    if chunks is not None:
+        chunks = list(chunks)
+    if penalty_range is not None:
+        fields.append(SWEEP_FIELD)
+        penalty_range = list(penalty_range)
+    if stage_cache_dir is not None or journal_files is not None:
+        parameters = {'backend': backend_version(backend)}
+        if penalty != PENALTY or penalty_range is not None:
+            parameters['penalty'] = penalty
+            parameters['penalty_range'] = penalty_range
+        if chunks is not None:
+            parameters['chunks'] = chunks
+        if r_batch:
+            parameters['r_batch'] = True
+    stage_cache = None
+    if stage_cache_dir is not None:
+        stage_cache = StageCache(stage_cache_dir, 'segmentations', parameters)
+    journals = [None] * len(all_results)
+    if journal_files is not None:
+        journals = [None if filename is None else
+                    Journal(filename, 'segmentations', parameters, resume)
+                    for filename in journal_files]
+    # Every (results, benchmark, pexec) triple is an independent job. Jobs are
+    # listed, and their results consumed, in a deterministic order. With the R
+    # backend and r_batch, the jobs of each benchmark are batched into one
+    # call into R; otherwise each batch holds one job. If chunks is not None, each long
+    # pexec is instead split into window jobs.
+    job_ids, job_args = list(), list()  # Lists of batches.
+    window_ids, window_args = list(), list()  # Windows of long pexecs.
+    window_starts = dict()  # (results, benchmark, pexec) -> start of each window.
+    cached, missed = dict(), dict()  # (results, benchmark) -> segmentation / digest.
+    reused = dict()  # (results, benchmark) -> segmentation of leading pexecs.
+    journal_digests = dict()  # (results, benchmark) -> digest.
+    remaining = dict()  # (results, benchmark) -> number of pexecs to segment.
+    crashed = list()  # (results, benchmark, pexec) triples.
+    reused_pexecs, total_pexecs = 0, 0
+    if previous is None:
+        previous = [None] * len(all_results)
+    for number, results in enumerate(all_results):
+        rm_outliers = 'all_outliers' in results
+        old = previous[number]
+        if old is not None and ('all_outliers' in old) != rm_outliers:
+            print('Previous changepoints used different outliers; recomputing all changepoints.')
+            old = None
+        if old is not None and (old.get('changepoint_penalty', PENALTY) != penalty or
+                                old.get('changepoint_penalty_range') != penalty_range or
+                                old.get('changepoint_chunks') != chunks):
+            print('Previous changepoints used a different penalty or chunks; recomputing all '
+                  'changepoints.')
+            old = None
+        for bench in sorted(results['wallclock_times']):
+            p_execs = results['wallclock_times'][bench]
+            outliers = _bench_outliers(results, bench)
+            if journals[number] is not None:
+                digest = journals[number].digest([p_execs, outliers])
+                journalled = journals[number].get(bench, digest)
+                if journalled is not None:
+                    cached[(number, bench)] = journalled
+                    continue
+                journal_digests[(number, bench)] = digest
+            if stage_cache is not None:
+                digest = stage_cache.digest([p_execs, outliers])
+                cached_results = stage_cache.get(digest)
+                if cached_results is not None:
+                    cached[(number, bench)] = cached_results
+                    continue
+                missed[(number, bench)] = digest
+            start = 0
+            if old is not None and bench in old.get('changepoints', {}):
+                start = min(len(old['changepoints'][bench]),
+                            _matching_prefix([old['wallclock_times'].get(bench, []),
+                                              _bench_outliers(old, bench)],
+                                             [p_execs, outliers]))
+            reused[(number, bench)] = dict((field, old[field][bench][:start] if start else [])
+                                           for field in fields)
+            reused_pexecs += start
+            total_pexecs += len(p_execs)
+            indices = list()
+            for index in xrange(start, len(p_execs)):
+                if len(p_execs[index]) == 0:
+                    crashed.append((number, bench, index))
+                elif (chunks is not None and
+                        len(p_execs[index]) - len(set(outliers[index])) > chunks[0]):
+                    windows, starts = get_chunk_jobs(p_execs[index], outliers[index],
+                                                     chunks[0], chunks[1], penalty)
+                    window_ids.extend([(number, bench, index)] * len(windows))
+                    window_args.extend(windows)
+                    window_starts[(number, bench, index)] = starts
+                else:
+                    indices.append(index)
+            if backend == 'r' and r_batch and indices:
+                batches = [indices]
+            else:
+                batches = [[index] for index in indices]
+            for batch in batches:
+                job_ids.append([(number, bench, index) for index in batch])
+                job_args.append([(p_execs[index], outliers[index]) for index in batch])
+
+    def journal_put(number, bench):
+        if (number, bench) in journal_digests:
+            journals[number].put(bench, journal_digests[(number, bench)],
+                                 dict((field, all_results[number][field][bench])
+                                      for field in fields))
+
+    for number, results in enumerate(all_results):
+        results.pop(SWEEP_FIELD, None)
+        for field in fields + ['classifications']:
+            results[field] = dict()
+        for bench in results['wallclock_times']:
+            segmentation = cached.get((number, bench), reused.get((number, bench)))
+            for field in fields:
+                results[field][bench] = list(segmentation[field])
+            results['classifications'][bench] = _classify_stored(
+                bench, results['wallclock_times'][bench], _bench_outliers(results, bench),
+                segmentation, delta, steady_state, raw_deltas)
+            # Results of jobs are stored in place of these.
+            pending = len(results['wallclock_times'][bench]) - len(segmentation['changepoints'])
+            for field in fields + ['classifications']:
+                results[field][bench].extend([None] * pending)
+            remaining[(number, bench)] = pending
+            if pending == 0:
+                journal_put(number, bench)
+
+    def store(number, bench, index, result):
+        changepoints, means, variances, classification, sweep = result
+        if classification is None and len(all_results[number]['wallclock_times'][bench][index]) > 0:
+            raise ValueError('Could not classify %s execution %d' % (bench, index + 1))
+        results = all_results[number]
+        results['changepoints'][bench][index] = changepoints
+        results['changepoint_means'][bench][index] = means
+        results['changepoint_vars'][bench][index] = variances
+        results['classifications'][bench][index] = classification
+        if sweep is not None:
+            results[SWEEP_FIELD][bench][index] = sweep
+        remaining[(number, bench)] -= 1
+        if remaining[(number, bench)] == 0:
+            journal_put(number, bench)
+
+    def add_profile(profile, bench):
+        if profile is not None:
+            for record in profile:
+                record['key'] = bench
+            profiling.add(profile)
+
+    for number, bench, index in crashed:
+        store(number, bench, index, ([], [], [], None, None))
+    if jobs > 1 and (job_args or window_args):
+        pool = multiprocessing.Pool(jobs, initializer=init_segments_worker,
+                                    initargs=(backend, delta, steady_state, raw_deltas,
+                                              penalty, penalty_range, r_batch))
+        window_results = pool.imap(window_worker, window_args)
+    else:
+        pool = None
+        init_segments_worker(backend, delta, steady_state, raw_deltas, penalty, penalty_range,
+                             r_batch)
+        window_results = (window_worker(window) for window in window_args)
+    # The pool is terminated however this loop ends (e.g. if a pexec cannot
+    # be classified), so that no workers are left behind.
+    try:
+        # The windows of each pexec are consecutive, so each pexec is reconciled
+        # (and its windows discarded) as soon as its last window is segmented.
+        all_cpts = list()
+        for position, (cpts, profile) in enumerate(window_results):
+            number, bench, index = window_ids[position]
+            add_profile(profile, bench)
+            all_cpts.append(cpts)
+            if position + 1 < len(window_ids) and window_ids[position + 1] == window_ids[position]:
+                continue
+            p_exec = all_results[number]['wallclock_times'][bench][index]
+            outliers = _bench_outliers(all_results[number], bench)[index]
+            with profiling.stage('changepoints', bench):
+                segments = reconcile_chunks(delta, steady_state, p_exec, outliers,
+                                            window_starts[(number, bench, index)], all_cpts,
+                                            raw_deltas, penalty)
+            with profiling.stage('classification', bench):
+                try:
+                    classification = segments.get_classification()
+                except ValueError:
+                    classification = None
+            store(number, bench, index, (segments.changepoints, segments.means,
+                                         segments.variances, classification, None))
+            all_cpts = list()
+        if pool is not None:
+            batch_results = pool.imap(segments_worker, job_args,
+                                      chunksize=1 if backend == 'r' else 4)
+        else:
+            batch_results = (segments_worker(batch) for batch in job_args)
+        for batch, (pexec_results, profile) in itertools.izip(job_ids, batch_results):
+            add_profile(profile, batch[0][1])
+            for (number, bench, index), result in zip(batch, pexec_results):
+                store(number, bench, index, result)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    for journal in journals:
+        if journal is not None:
+            journal.close()
+            if resume:
+                print('Resume: reused changepoints for %d benchmark(s) from %s.' %
+                      (journal.resumed, journal.filename))
+    if stage_cache is not None:
+        for (number, bench), digest in sorted(missed.items()):
+            stage_cache.put(digest, dict((field, all_results[number][field][bench])
+                                         for field in fields))
+        print('Stage cache: reused changepoints for %d benchmark(s), computed %d.' %
+              (stage_cache.hits, stage_cache.misses))
+    if any(old is not None for old in previous):
+        print('Incremental: reused changepoints for %d of %d process execution(s).' %
+              (reused_pexecs, total_pexecs))
+    for results in all_results:
+        results['classifier'] = { 'delta':delta, 'steady':steady_state }
+        _set_segmenter(results, penalty, penalty_range, chunks)
+
+
+def _select_penalty(results, penalty):
+    """Replace the segmentation of every process execution in results with
+    the one picked from its penalty sweep for penalty.
+    """
+    from warmup.changepoints import SEGMENTATION_FIELDS, SWEEP_FIELD, select_penalty
+    penalty_range = results['changepoint_penalty_range']
+    if not penalty_range[0] <= penalty <= penalty_range[1]:
+        raise ValueError('Penalty %g is outside the range of the penalty sweep (%g to %g).' %
+                         (penalty, penalty_range[0], penalty_range[1]))
+    for field in SEGMENTATION_FIELDS:
+        results[field] = dict()
+    for bench in results['wallclock_times']:
+        for field in SEGMENTATION_FIELDS:
+            results[field][bench] = list()
+        for p_exec, outliers, sweep in zip(results['wallclock_times'][bench],
+                                           _bench_outliers(results, bench),
+                                           results[SWEEP_FIELD][bench]):
+            if len(p_exec) == 0:  # Crashed, so not segmented.
+                segmentation = ([], [], [])
+            else:
+                segmentation = select_penalty(p_exec, outliers, sweep, penalty)
+            for field, value in zip(SEGMENTATION_FIELDS, segmentation):
+                results[field][bench].append(value)
+    _set_segmenter(results, penalty, penalty_range)
+
+
+def reclassify(all_results, delta, steady_state, raw_deltas, penalty=None):
+    """Classify every process execution of each of a list of Krun results
+    again, with new classifier options, from the changepoints and segment
+    means and variances stored by an earlier run of mark_changepoints(). The
+    expensive segmentation is not repeated. Classifications and the
+    classifier options are replaced in place.
+
+    If penalty is not None, the segmentation of each process execution is
+    first replaced by the one for penalty from its penalty sweep (see
+    mark_changepoints()), which must include penalty.
+
+    Raises ValueError if any results have not been segmented (or swept, if
+    penalty is not None), or any process execution which did not crash cannot
+    be classified.
+    """
+    from warmup.changepoints import SEGMENTATION_FIELDS, SWEEP_FIELD
+    for results in all_results:
+        if 'changepoints' not in results:
+            raise ValueError('No changepoints found; please run mark_changepoints_in_json '
+                             'before reclassifying.')
+        if penalty is not None:
+            if SWEEP_FIELD not in results:
+                raise ValueError('No penalty sweep found; please run '
+                                 'mark_changepoints_in_json with --penalty-range before '
+                                 'picking a penalty.')
+            _select_penalty(results, penalty)
+        classifications = dict()
+        for bench in results['wallclock_times']:
+            segmentation = dict((field, results[field][bench]) for field in SEGMENTATION_FIELDS)
+            classifications[bench] = _classify_stored(bench, results['wallclock_times'][bench],
+                                                      _bench_outliers(results, bench),
+                                                      segmentation, delta, steady_state,
+                                                      raw_deltas)
+        results['classifications'] = classifications
+        results['classifier'] = { 'delta':delta, 'steady':steady_state }
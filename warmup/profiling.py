@@ -0,0 +1,175 @@
+"""Optional profiling of the stages of the warmup_stats pipeline.
+
+Library code wraps each stage (decompressing and parsing results files,
+marking outliers, detecting changepoints, bootstrapping, rendering, writing
+files) in stage(), optionally naming the benchmark key being processed.
+Nothing is recorded unless a script has called enable() (e.g. because it was
+passed --profile), in which case each stage records its wall clock time, CPU
+time and the resident set size (RSS) of the process at its start and end.
+Python 2 has no tracemalloc, so the RSS is read from /proc/self/statm. The
+peak RSS of the process (from getrusage()) is only reported for the whole
+run, since it covers every stage run so far, not just the current one.
+
+Stages which run in worker processes are recorded with capture(), and the
+records are returned to the parent, which passes them to add().
+"""
+
+import json
+import os
+import resource
+import sys
+import time
+
+from collections import OrderedDict
+from contextlib import contextmanager
+
+_PAGE_SIZE_KB = os.sysconf('SC_PAGE_SIZE') // 1024
+_RECORDS = None  # List of records, or None if profiling is disabled.
+_SCRIPT = None
+_STARTED = None
+
+
+def _cpu_time(children=False):
+    times = os.times()
+    if children:  # Includes worker processes which have exited.
+        return sum(times[:4])
+    return times[0] + times[1]  # User and system time of this process.
+
+
+def _peak_rss_kb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':  # Reported in bytes, rather than KiB.
+        peak //= 1024
+    return peak
+
+
+def _rss_kb():
+    """Return the current RSS of this process. Where there is no /proc (e.g.
+    on OS X) the peak RSS so far is returned instead.
+    """
+    try:
+        with open('/proc/self/statm', 'r') as fd:
+            return int(fd.read().split()[1]) * _PAGE_SIZE_KB
+    except IOError:
+        return _peak_rss_kb()
+
+
+def enable(script):
+    """Start recording stages, run by script (the name of a bin/ script)."""
+    global _RECORDS, _SCRIPT, _STARTED
+    _RECORDS = list()
+    _SCRIPT = script
+    _STARTED = (time.time(), _cpu_time(children=True))
+
+
+def enabled():
+    return _RECORDS is not None
+
+
+@contextmanager
+def stage(name, key=None):
+    """Record the time taken by, and the RSS before and after, the body of the
+    with statement, as one run of stage name (for benchmark key, if not None).
+    """
+    if _RECORDS is None:
+        yield
+        return
+    rss_start = _rss_kb()
+    wall, cpu = time.time(), _cpu_time()
+    try:
+        yield
+    finally:
+        wall, cpu = time.time() - wall, _cpu_time() - cpu
+        rss_end = _rss_kb()
+        _RECORDS.append({'script': _SCRIPT, 'stage': name, 'key': key,
+                         'wall': wall, 'cpu': cpu, 'pid': os.getpid(),
+                         'rss_start_kb': rss_start, 'rss_end_kb': rss_end,
+                         'rss_growth_kb': rss_end - rss_start})
+
+
+@contextmanager
+def capture():
+    """Record stages run in the body of the with statement (e.g. in a worker
+    process) in a new list, which is the target of the with statement, rather
+    than in the records of this process. The target is None if profiling is
+    disabled.
+    """
+    global _RECORDS
+    saved = _RECORDS
+    if _RECORDS is not None:
+        _RECORDS = list()
+    try:
+        yield _RECORDS
+    finally:
+        _RECORDS = saved
+
+
+def add(records):
+    """Add records (as made by capture(), or read from another report)."""
+    if _RECORDS is not None and records:
+        _RECORDS.extend(records)
+
+
+def _totals(records):
+    totals = OrderedDict()
+    for record in records:
+        total = totals.setdefault(record['stage'], {'calls': 0, 'wall': 0.0, 'cpu': 0.0,
+                                                    'rss_end_kb': 0, 'rss_growth_kb': 0})
+        total['calls'] += 1
+        total['wall'] += record['wall']
+        total['cpu'] += record['cpu']
+        total['rss_end_kb'] = max(total['rss_end_kb'], record['rss_end_kb'])
+        total['rss_growth_kb'] = max(total['rss_growth_kb'], record['rss_growth_kb'])
+    return totals
+
+
+def report():
+    """Return the profile recorded so far: every record, and totals for each
+    stage, and for each stage of each benchmark key. The totals hold the
+    largest RSS at the end of, and the largest growth in RSS during, any run
+    of the stage.
+    """
+    assert _RECORDS is not None, 'Profiling has not been enabled.'
+    by_key = dict()
+    for record in _RECORDS:
+        if record['key'] is not None:
+            by_key.setdefault(record['key'], list()).append(record)
+    return {'script': _SCRIPT,
+            'argv': sys.argv,
+            'wall': time.time() - _STARTED[0],
+            'cpu': _cpu_time(children=True) - _STARTED[1],
+            'peak_rss_kb': _peak_rss_kb(),
+            'totals': _totals(_RECORDS),
+            'keys': dict((key, _totals(by_key[key])) for key in by_key),
+            'stages': _RECORDS}
+
+
+def write_report(filename):
+    """Write the profile recorded so far to filename as JSON, and return it."""
+    profile = report()
+    with open(filename, 'w') as fd:
+        json.dump(profile, fd, indent=4)
+    return profile
+
+
+def format_summary(profile, slowest=5):
+    """Return a short text summary of a profile, as returned by report(). Stages
+    may be nested (or run in worker processes), so their times need not add
+    up to the total. The peak RSS is that of the whole process; the RSS
+    columns are measured at the start and end of each stage.
+    """
+    lines = ['Profile of %s: %.3fs wall clock, %.3fs CPU, process peak RSS %.1f MiB.' %
+             (profile['script'], profile['wall'], profile['cpu'],
+              profile['peak_rss_kb'] / 1024.0),
+             '%-24s %6s %10s %10s %14s %14s' % ('Stage', 'Calls', 'Wall (s)', 'CPU (s)',
+                                                'End RSS (MiB)', 'Growth (MiB)')]
+    for name, total in profile['totals'].items():
+        lines.append('%-24s %6d %10.3f %10.3f %14.1f %14.1f' %
+                     (name, total['calls'], total['wall'], total['cpu'],
+                      total['rss_end_kb'] / 1024.0, total['rss_growth_kb'] / 1024.0))
+    key_walls = sorted(((sum(total['wall'] for total in profile['keys'][key].values()), key)
+                        for key in profile['keys']), reverse=True)
+    if key_walls:
+        lines.append('Slowest benchmarks: %s.' % ', '.join('%s (%.3fs)' % (key, wall)
+                                                           for wall, key in key_walls[:slowest]))
+    return '\n'.join(lines)
@@ -0,0 +1,73 @@
+"""A content-addressed cache for the results of pipeline stages.
+
+Stages which annotate Krun results files (marking outliers, marking
+changepoints) compute their results one benchmark key at a time. A StageCache
+stores those per-benchmark results on disk, under a hash of the input data for
+the benchmark and the parameters of the stage. A stage can therefore skip any
+benchmark whose data it has already processed with the same parameters, even
+if that data now appears in a different (e.g. newer) results file.
+"""
+
+import errno
+import hashlib
+import json
+import os
+import os.path
+import tempfile
+
+from warmup.krun_results import array_to_list
+
+# Change this whenever the format of cached results changes.
+_CACHE_FORMAT = 1
+
+
+class StageCache(object):
+    """Results of one stage, run with one set of parameters, stored in
+    directory/stage/. parameters must be JSON serialisable, and should include
+    everything (other than the input data) which may change the results.
+    """
+
+    def __init__(self, directory, stage, parameters):
+        self.directory = os.path.join(directory, stage)
+        self.hits = 0
+        self.misses = 0
+        self._prefix = json.dumps([_CACHE_FORMAT, stage, parameters], sort_keys=True)
+
+    def digest(self, data):
+        """Return a hash of the input data for one benchmark, and the
+        parameters of this stage. data must be JSON serialisable, apart from
+        any NumPy arrays (e.g. run sequences read from a results cache).
+        """
+        sha1 = hashlib.sha1(self._prefix)
+        sha1.update(json.dumps(data, sort_keys=True, separators=(',', ':'),
+                               default=array_to_list))
+        return sha1.hexdigest()
+
+    def _path(self, digest):
+        return os.path.join(self.directory, digest[:2], digest + '.json')
+
+    def get(self, digest):
+        """Return the results stored under digest, or None."""
+        try:
+            with open(self._path(digest), 'r') as fd:
+                results = json.load(fd)
+        except (IOError, ValueError):  # Missing or unreadable.
+            self.misses += 1
+            return None
+        self.hits += 1
+        return results
+
+    def put(self, digest, results):
+        """Store results under digest. Entries are written to a temporary file
+        and renamed, so concurrent readers never see partial results.
+        """
+        path = self._path(digest)
+        try:
+            os.makedirs(os.path.dirname(path))
+        except OSError as error:
+            if error.errno != errno.EEXIST:
+                raise
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'w') as file_:
+            json.dump(results, file_)
+        os.rename(tmp_path, path)
@@ -1,38 +1,69 @@
+import math
 import numpy
-import os
-import subprocess
-import traceback
+
+from warmup.bootstrapper import BOOTSTRAP_ITERATIONS_HIGHQ, BOOTSTRAP_ITERATIONS_LOWQ
+from warmup.bootstrapper import CONFIDENCE_LEVEL, median_ci
 
 
 LOW_IQR_BOUND = 5.0
 HIGH_IQR_BOUND = 95.0
 
-BOOTSTRAPPER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'warmup', 'bootstrapper.py')
+# Maximum number of resample indices bootstrap_steady_perf() draws at once.
+BOOTSTRAP_MAX_ELEMENTS = 2 ** 22
 
 
 def median_iqr(seq):
     return numpy.median(seq), (numpy.percentile(seq, LOW_IQR_BOUND), numpy.percentile(seq, HIGH_IQR_BOUND))
 
 
-def bootstrap_runner(marshalled_data, quality='HIGH'):
-    """Input should be a JSON string, containing a list of pexecs, each
-    containing a list of segments, each containing a list of floats.
+def _bootstrap_means(steady_segments_all_pexecs, iterations):
+    """Vectorised equivalent of _bootstrap_means_highq() in bootstrapper.py.
+    Each resample of a pexec draws len(seg) values (with replacement) from
+    each of its segments, and the mean of the whole resample is recorded.
+    Resample indices are drawn in bulk, in chunks of at most
+    BOOTSTRAP_MAX_ELEMENTS, so that memory use stays bounded.
     """
+    # As in bootstrapper.py, add 1 to ensure that we end up with
+    # >= iterations resamples in total.
+    n_resamples = int(math.floor(iterations / len(steady_segments_all_pexecs))) + 1
+    means = numpy.empty(n_resamples * len(steady_segments_all_pexecs))
+    for pexec_index, segments in enumerate(steady_segments_all_pexecs):
+        data = numpy.concatenate([numpy.asarray(seg, dtype=numpy.float64) for seg in segments])
+        num_samples = len(data)
+        assert num_samples, '_bootstrap_means() received no data to resample.'
+        chunk = max(1, BOOTSTRAP_MAX_ELEMENTS // num_samples)
+        for start in xrange(0, n_resamples, chunk):
+            size = min(chunk, n_resamples - start)
+            indices = numpy.empty((size, num_samples), dtype=numpy.intp)
+            offset = 0
+            for seg in segments:
+                seg_len = len(seg)
+                if seg_len == 0:
+                    continue
+                indices[:, offset:offset + seg_len] = \
+                    numpy.random.randint(0, seg_len, size=(size, seg_len)) + offset
+                offset += seg_len
+            first = pexec_index * n_resamples + start
+            means[first:first + size] = data[indices].sum(axis=1) / float(num_samples)
+    assert len(means) >= iterations
+    return means
 
-    try:
-        pipe = subprocess.Popen(['pypy', BOOTSTRAPPER, '--quality', quality],
-                                stdin=subprocess.PIPE,
-                                stdout=subprocess.PIPE)
-        pipe.stdin.write(marshalled_data + '\n')
-        pipe.stdin.flush()
-        output = pipe.stdout.readline().strip()
-        mean_str, ci_str =  output.split(',')
-        mean, ci = float(mean_str), float(ci_str)
-        return mean, ci
-    except:
-        print 'Bootstrapper script failed:'
-        traceback.print_exc()
-        return None, None
+
+def bootstrap_steady_perf(steady_segments_all_pexecs, quality='HIGH',
+                          confidence_level=CONFIDENCE_LEVEL):
+    """In-process, NumPy equivalent of bootstrapper.bootstrap_steady_perf().
+    Input is a list containing a list for each pexec, containing a list of
+    segments with iteration times. Returns a (median, CI) pair.
+    """
+    if quality.lower() == 'high':
+        iterations = BOOTSTRAP_ITERATIONS_HIGHQ
+    elif quality.lower() == 'low':
+        iterations = BOOTSTRAP_ITERATIONS_LOWQ
+    else:
+        raise ValueError("Unknown quality level '%s'" % quality)
+    means = _bootstrap_means(steady_segments_all_pexecs, iterations)
+    means.sort()
+    return median_ci(means, confidence_level)
 
 
 def get_absolute_delta_using_fastest_seg(delta, seg_means):
@@ -1,13 +1,15 @@
-import json
 import math
+import multiprocessing
+import numpy
 
 from collections import Counter, OrderedDict
+from warmup import profiling
 from warmup.html import DIFF_LEGEND, get_symbol, html_histogram, HTML_TABLE_TEMPLATE
 from warmup.html import HTML_DIFF_TABLE_TEMPLATE, HTML_PAGE_TEMPLATE, HTML_SYMBOLS
 from warmup.latex import end_document, end_longtable, end_table, escape, format_median_ci
 from warmup.latex import format_median_error, get_latex_symbol_map, preamble
 from warmup.latex import start_longtable, start_table, STYLE_SYMBOLS
-from warmup.statistics import (bootstrap_runner, median_iqr,
+from warmup.statistics import (bootstrap_steady_perf, median_iqr,
                                get_absolute_delta_using_fastest_seg)
 
 JSON_VERSION_NUMBER = '2'
@@ -36,11 +38,18 @@ SKIPPED_BEFORE = 0
 SKIPPED_AFTER = 1
 
 
-def collect_summary_statistics(data_dictionaries, delta, steady_state, quality='HIGH'):
+SUMMARY_FIELDS = ['wallclock_times', 'changepoints', 'changepoint_means',
+                  'changepoint_vars', 'all_outliers', 'classifications']
+
+
+def collect_summary_statistics(data_dictionaries, delta, steady_state, quality='HIGH', jobs=1):
     """Create summary statistics of a dataset with classifications.
     Note that this function returns a dict which is consumed by other code to
     create tables. It also DEFINES the JSON format which the ../bin/warmup_stats
     script dumps to file.
+
+    If jobs > 1, benchmark keys are summarised in parallel by a pool of jobs
+    worker processes. The resulting dict is the same either way.
     """
 
     assert type(delta) in [str, unicode]
@@ -53,164 +62,215 @@ def collect_summary_statistics(data_dictionaries, delta, steady_state, quality='
     summary_data = { 'machines': { machine: dict() }, 'warmup_format_version': JSON_VERSION_NUMBER }
     # Parse data dictionaries.
     keys = sorted(data_dictionaries[machine]['wallclock_times'].keys())
-    for key in sorted(keys):
+    tasks = list()
+    for key in keys:
         wallclock_times = data_dictionaries[machine]['wallclock_times'][key]
-        if len(wallclock_times) == 0:
-            print('WARNING: Skipping: %s from %s (no executions)' %
-                   (key, machine))
-        elif len(wallclock_times[0]) == 0:
-            print('WARNING: Skipping: %s from %s (benchmark crashed)' %
-                  (key, machine))
+        if len(wallclock_times) == 0 or len(wallclock_times[0]) == 0:
+            # Skipped benchmark, needs only its wallclock times.
+            key_data = {'wallclock_times': wallclock_times}
         else:
-            bench, vm, variant = key.split(':')
-            if vm not in summary_data['machines'][machine].keys():
-                summary_data['machines'][machine][vm] = dict()
-            # Get information for all p_execs of this key.
-            categories = list()
-            steady_state_means = list()
-            steady_iters = list()
-            time_to_steadys = list()
-            n_pexecs = len(data_dictionaries[machine]['wallclock_times'][key])
-            segments_for_bootstrap_all_pexecs = list()  # Steady state segments for all pexecs.
-            # Lists of changepoints, outliers and segment means for each process execution.
-            changepoints, outliers, segments = list(), list(), list()
-            for p_exec in xrange(n_pexecs):
-                segments_for_bootstrap_this_pexec = list()  # Steady state segments for this pexec.
-                changepoints.append(data_dictionaries[machine]['changepoints'][key][p_exec])
-                segments.append(data_dictionaries[machine]['changepoint_means'][key][p_exec])
-                outliers.append(data_dictionaries[machine]['all_outliers'][key][p_exec])
-                categories.append(data_dictionaries[machine]['classifications'][key][p_exec])
-                # Next we calculate the iteration at which a steady state was
-                # reached, it's average segment mean and the time to reach a
-                # steady state. However, the last segment may be equivalent to
-                # its adjacent segments, so we first need to know which segments
-                # are steady-state segments.
-                if data_dictionaries[machine]['classifications'][key][p_exec] == 'no steady state':
-                    continue
-                # Capture the last steady state segment for bootstrapping.
+            key_data = dict()
+            for field in SUMMARY_FIELDS:
+                key_data[field] = data_dictionaries[machine][field][key]
+        tasks.append((machine, key, key_data, delta, steady_state, quality))
+    if jobs > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(jobs, initializer=_init_summary_worker)
+        try:
+            # imap() returns results in the same order as tasks.
+            results = pool.imap(_summarise_benchmark_task, tasks)
+            _collect_benchmark_summaries(summary_data, machine, keys, results)
+        except:
+            pool.terminate()
+            raise
+        pool.close()
+        pool.join()
+    else:
+        results = (_summarise_benchmark_task(task) for task in tasks)
+        _collect_benchmark_summaries(summary_data, machine, keys, results)
+    return summary_data
+
+
+def _collect_benchmark_summaries(summary_data, machine, keys, results):
+    """Add the summary of each benchmark key to summary_data, in key order."""
+
+    for key, ((warning, current_benchmark), profile) in zip(keys, results):
+        profiling.add(profile)
+        if warning is not None:
+            print(warning)
+            continue
+        bench, vm, variant = key.split(':')
+        if vm not in summary_data['machines'][machine].keys():
+            summary_data['machines'][machine][vm] = dict()
+        summary_data['machines'][machine][vm][bench] = current_benchmark
+
+
+def _init_summary_worker():
+    # Forked workers inherit the parent's random state, so re-seed each one
+    # to keep their bootstrap resamples independent.
+    numpy.random.seed()
+
+
+def _summarise_benchmark_task(task):
+    with profiling.capture() as profile:
+        result = summarise_benchmark(*task)
+    return result, profile
+
+
+def summarise_benchmark(machine, key, key_data, delta, steady_state, quality='HIGH'):
+    """Summarise all process executions of one benchmark key.
+    key_data maps each field in SUMMARY_FIELDS to the data for this key.
+    Returns a (warning, summary) pair: if the benchmark has to be skipped,
+    warning is a message explaining why and summary is None.
+    """
+
+    wallclock_times = key_data['wallclock_times']
+    if len(wallclock_times) == 0:
+        return ('WARNING: Skipping: %s from %s (no executions)' % (key, machine), None)
+    elif len(wallclock_times[0]) == 0:
+        return ('WARNING: Skipping: %s from %s (benchmark crashed)' % (key, machine), None)
+    # Get information for all p_execs of this key.
+    categories = list()
+    steady_state_means = list()
+    steady_iters = list()
+    time_to_steadys = list()
+    n_pexecs = len(key_data['wallclock_times'])
+    segments_for_bootstrap_all_pexecs = list()  # Steady state segments for all pexecs.
+    # Lists of changepoints, outliers and segment means for each process execution.
+    changepoints, outliers, segments = list(), list(), list()
+    indices = list()  # Indices of the process executions which did not crash.
+    for p_exec in xrange(n_pexecs):
+        if len(key_data['wallclock_times'][p_exec]) == 0:
+            continue  # Crashed, so not classified.
+        indices.append(p_exec)
+        segments_for_bootstrap_this_pexec = list()  # Steady state segments for this pexec.
+        changepoints.append(key_data['changepoints'][p_exec])
+        segments.append(key_data['changepoint_means'][p_exec])
+        outliers.append(key_data['all_outliers'][p_exec])
+        categories.append(key_data['classifications'][p_exec])
+        # Next we calculate the iteration at which a steady state was
+        # reached, it's average segment mean and the time to reach a
+        # steady state. However, the last segment may be equivalent to
+        # its adjacent segments, so we first need to know which segments
+        # are steady-state segments.
+        if key_data['classifications'][p_exec] == 'no steady state':
+            continue
+        # Capture the last steady state segment for bootstrapping.
+        segment_data = list()
+        if key_data['changepoints'][p_exec]:
+            start = key_data['changepoints'][p_exec][-1]
+        else:
+            start = 0  # No changepoints in this pexec.
+        end = len(key_data['wallclock_times'][p_exec])
+        for segment_index in xrange(start, end):
+            if segment_index in key_data['all_outliers'][p_exec]:
+                continue
+            segment_data.append(key_data['wallclock_times'][p_exec][segment_index])
+        segments_for_bootstrap_this_pexec.append(segment_data)
+
+        abs_delta = get_absolute_delta_using_fastest_seg(
+            delta, key_data['changepoint_means'][p_exec])
+
+        first_steady_segment = len(key_data['changepoint_means'][p_exec]) - 1
+        num_steady_segments = 1
+        last_segment_mean = key_data['changepoint_means'][p_exec][-1]
+        last_segment_var = key_data['changepoint_vars'][p_exec][-1]
+        lower_bound = min(last_segment_mean - last_segment_var, last_segment_mean - abs_delta)
+        upper_bound = max(last_segment_mean + last_segment_var, last_segment_mean + abs_delta)
+        # This for loop deals with segments that are equivalent to the
+        # final, steady state segment.
+        for index in xrange(len(key_data['changepoint_means'][p_exec]) - 2, -1, -1):
+            current_segment_mean = key_data['changepoint_means'][p_exec][index]
+            current_segment_var = key_data['changepoint_vars'][p_exec][index]
+            if (current_segment_mean + current_segment_var >= lower_bound and
+                    current_segment_mean - current_segment_var<= upper_bound):
+                # Extract this segment from the wallclock data for bootstrapping.
                 segment_data = list()
-                if data_dictionaries[machine]['changepoints'][key][p_exec]:
-                    start = data_dictionaries[machine]['changepoints'][key][p_exec][-1]
+                if index == 0:
+                    start = 0
+                    end = key_data['changepoints'][p_exec][index] + 1
                 else:
-                    start = 0  # No changepoints in this pexec.
-                end = len(data_dictionaries[machine]['wallclock_times'][key][p_exec])
+                    start = key_data['changepoints'][p_exec][index - 1] + 1
+                    end = key_data['changepoints'][p_exec][index] + 1
                 for segment_index in xrange(start, end):
-                    if segment_index in data_dictionaries[machine]['all_outliers'][key][p_exec]:
+                    if segment_index in key_data['all_outliers'][p_exec]:
                         continue
-                    segment_data.append(data_dictionaries[machine]['wallclock_times'][key][p_exec][segment_index])
+                    segment_data.append(key_data['wallclock_times'][p_exec][segment_index])
                 segments_for_bootstrap_this_pexec.append(segment_data)
-
-                abs_delta = get_absolute_delta_using_fastest_seg(
-                    delta, data_dictionaries[machine]['changepoint_means'][key][p_exec])
-
-                first_steady_segment = len(data_dictionaries[machine]['changepoint_means'][key][p_exec]) - 1
-                num_steady_segments = 1
-                last_segment_mean = data_dictionaries[machine]['changepoint_means'][key][p_exec][-1]
-                last_segment_var = data_dictionaries[machine]['changepoint_vars'][key][p_exec][-1]
-                lower_bound = min(last_segment_mean - last_segment_var, last_segment_mean - abs_delta)
-                upper_bound = max(last_segment_mean + last_segment_var, last_segment_mean + abs_delta)
-                # This for loop deals with segments that are equivalent to the
-                # final, steady state segment.
-                for index in xrange(len(data_dictionaries[machine]['changepoint_means'][key][p_exec]) - 2, -1, -1):
-                    current_segment_mean = data_dictionaries[machine]['changepoint_means'][key][p_exec][index]
-                    current_segment_var = data_dictionaries[machine]['changepoint_vars'][key][p_exec][index]
-                    if (current_segment_mean + current_segment_var >= lower_bound and
-                            current_segment_mean - current_segment_var<= upper_bound):
-                        # Extract this segment from the wallclock data for bootstrapping.
-                        segment_data = list()
-                        if index == 0:
-                            start = 0
-                            end = data_dictionaries[machine]['changepoints'][key][p_exec][index] + 1
-                        else:
-                            start = data_dictionaries[machine]['changepoints'][key][p_exec][index - 1] + 1
-                            end = data_dictionaries[machine]['changepoints'][key][p_exec][index] + 1
-                        for segment_index in xrange(start, end):
-                            if segment_index in data_dictionaries[machine]['all_outliers'][key][p_exec]:
-                                continue
-                            segment_data.append(data_dictionaries[machine]['wallclock_times'][key][p_exec][segment_index])
-                        segments_for_bootstrap_this_pexec.append(segment_data)
-                        # Increment / decrement counters.
-                        first_steady_segment -= 1
-                        num_steady_segments += 1
-                    else:
-                        break
-                segments_for_bootstrap_all_pexecs.append(segments_for_bootstrap_this_pexec)
-                # End of code to capture segments for bootstrapping.
-                steady_state_mean = (math.fsum(data_dictionaries[machine]['changepoint_means'][key][p_exec][first_steady_segment:])
-                                     / float(num_steady_segments))
-                steady_state_means.append(steady_state_mean)
-                # Not all process execs have changepoints. However, all
-                # p_execs will have one or more segment mean.
-                if data_dictionaries[machine]['classifications'][key][p_exec] != 'flat':
-                    steady_iter = data_dictionaries[machine]['changepoints'][key][p_exec][first_steady_segment - 1]
-                    steady_iters.append(steady_iter + 1)
-                    to_steady = 0.0
-                    for index in xrange(steady_iter):
-                        to_steady += data_dictionaries[machine]['wallclock_times'][key][p_exec][index]
-                    time_to_steadys.append(to_steady)
-                else:  # Flat execution, with no changepoints.
-                    steady_iters.append(1)
-                    time_to_steadys.append(0.0)
-            # Get overall and detailed categories.
-            categories_set = set(categories)
-            if len(categories_set) == 1:  # NB some benchmarks may have errored.
-                reported_category = categories[0]
-            elif categories_set == set(['flat', 'warmup']):
-                reported_category = 'good inconsistent'
-            else:  # Bad inconsistent.
-                reported_category = 'bad inconsistent'
-            cat_counts = dict()
-            for category, occurences in Counter(categories).most_common():
-                cat_counts[category] = occurences
-            for category in ['flat', 'warmup', 'slowdown', 'no steady state']:
-                if category not in cat_counts:
-                    cat_counts[category] = 0
-            # Average information for all process executions.
-            if cat_counts['no steady state'] > 0:
-                mean_time, error_time = None, None
-                median_iter, error_iter = None, None
-                median_time_to_steady, error_time_to_steady = None, None
-            elif categories_set == set(['flat']):
-                median_iter, error_iter = None, None
-                median_time_to_steady, error_time_to_steady = None, None
-                # Shell out to PyPy for speed.
-                marshalled_data = json.dumps(segments_for_bootstrap_all_pexecs)
-                mean_time, error_time = bootstrap_runner(marshalled_data, quality)
-                if mean_time is None or error_time is None:
-                    raise ValueError()
+                # Increment / decrement counters.
+                first_steady_segment -= 1
+                num_steady_segments += 1
             else:
-                # Shell out to PyPy for speed.
-                marshalled_data = json.dumps(segments_for_bootstrap_all_pexecs)
-                mean_time, error_time = bootstrap_runner(marshalled_data, quality)
-                if mean_time is None or error_time is None:
-                    raise ValueError()
-                if steady_iters:
-                    median_iter, error_iter = median_iqr([float(val) for val in steady_iters])
-                    median_time_to_steady, error_time_to_steady = median_iqr(time_to_steadys)
-                else:  # No changepoints in any process executions.
-                    assert False  # Should be handled by elif clause above.
-            # Add summary for this benchmark.
-            current_benchmark = dict()
-            current_benchmark['classification'] = reported_category
-            current_benchmark['detailed_classification'] = cat_counts
-            current_benchmark['steady_state_iteration'] = median_iter
-            current_benchmark['steady_state_iteration_iqr'] = error_iter
-            current_benchmark['steady_state_iteration_list'] = steady_iters
-            current_benchmark['steady_state_time_to_reach_secs'] = median_time_to_steady
-            current_benchmark['steady_state_time_to_reach_secs_iqr'] = error_time_to_steady
-            current_benchmark['steady_state_time_to_reach_secs_list'] = time_to_steadys
-            current_benchmark['steady_state_time'] = mean_time
-            current_benchmark['steady_state_time_ci'] = error_time
-            current_benchmark['steady_state_time_list'] = steady_state_means
-
-            pexecs = list()  # This is needed for JSON output.
-            for index in xrange(n_pexecs):
-                pexecs.append({'index':index, 'classification':categories[index],
-                              'outliers':outliers[index], 'changepoints':changepoints[index],
-                              'segment_means':segments[index]})
-            current_benchmark['process_executons'] = pexecs
-            summary_data['machines'][machine][vm][bench] = current_benchmark
-    return summary_data
+                break
+        segments_for_bootstrap_all_pexecs.append(segments_for_bootstrap_this_pexec)
+        # End of code to capture segments for bootstrapping.
+        steady_state_mean = (math.fsum(key_data['changepoint_means'][p_exec][first_steady_segment:])
+                             / float(num_steady_segments))
+        steady_state_means.append(steady_state_mean)
+        # Not all process execs have changepoints. However, all
+        # p_execs will have one or more segment mean.
+        if key_data['classifications'][p_exec] != 'flat':
+            steady_iter = key_data['changepoints'][p_exec][first_steady_segment - 1]
+            steady_iters.append(steady_iter + 1)
+            to_steady = 0.0
+            for index in xrange(steady_iter):
+                to_steady += key_data['wallclock_times'][p_exec][index]
+            time_to_steadys.append(to_steady)
+        else:  # Flat execution, with no changepoints.
+            steady_iters.append(1)
+            time_to_steadys.append(0.0)
+    # Get overall and detailed categories.
+    categories_set = set(categories)
+    if len(categories_set) == 1:  # NB some benchmarks may have errored.
+        reported_category = categories[0]
+    elif categories_set == set(['flat', 'warmup']):
+        reported_category = 'good inconsistent'
+    else:  # Bad inconsistent.
+        reported_category = 'bad inconsistent'
+    cat_counts = dict()
+    for category, occurences in Counter(categories).most_common():
+        cat_counts[category] = occurences
+    for category in ['flat', 'warmup', 'slowdown', 'no steady state']:
+        if category not in cat_counts:
+            cat_counts[category] = 0
+    # Average information for all process executions.
+    if cat_counts['no steady state'] > 0:
+        mean_time, error_time = None, None
+        median_iter, error_iter = None, None
+        median_time_to_steady, error_time_to_steady = None, None
+    elif categories_set == set(['flat']):
+        median_iter, error_iter = None, None
+        median_time_to_steady, error_time_to_steady = None, None
+        with profiling.stage('bootstrap', key):
+            mean_time, error_time = bootstrap_steady_perf(segments_for_bootstrap_all_pexecs, quality)
+    else:
+        with profiling.stage('bootstrap', key):
+            mean_time, error_time = bootstrap_steady_perf(segments_for_bootstrap_all_pexecs, quality)
+        if steady_iters:
+            median_iter, error_iter = median_iqr([float(val) for val in steady_iters])
+            median_time_to_steady, error_time_to_steady = median_iqr(time_to_steadys)
+        else:  # No changepoints in any process executions.
+            assert False  # Should be handled by elif clause above.
+    # Add summary for this benchmark.
+    current_benchmark = dict()
+    current_benchmark['classification'] = reported_category
+    current_benchmark['detailed_classification'] = cat_counts
+    current_benchmark['steady_state_iteration'] = median_iter
+    current_benchmark['steady_state_iteration_iqr'] = error_iter
+    current_benchmark['steady_state_iteration_list'] = steady_iters
+    current_benchmark['steady_state_time_to_reach_secs'] = median_time_to_steady
+    current_benchmark['steady_state_time_to_reach_secs_iqr'] = error_time_to_steady
+    current_benchmark['steady_state_time_to_reach_secs_list'] = time_to_steadys
+    current_benchmark['steady_state_time'] = mean_time
+    current_benchmark['steady_state_time_ci'] = error_time
+    current_benchmark['steady_state_time_list'] = steady_state_means
+
+    pexecs = list()  # This is needed for JSON output.
+    for position, index in enumerate(indices):
+        pexecs.append({'index':index, 'classification':categories[position],
+                      'outliers':outliers[position], 'changepoints':changepoints[position],
+                      'segment_means':segments[position]})
+    current_benchmark['process_executons'] = pexecs
+    return None, current_benchmark
 
 
 def convert_to_latex(summary_data, delta, steady_state, diff=None, previous=None):